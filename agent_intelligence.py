@@ -5,6 +5,13 @@
 def priceFirstOrderAdaptive(aspiration: float, price: float, alpha: float) -> float:
     return alpha * price + (1 - alpha) * aspiration
 
+# Anchor and adjust module applied to every state in states at once
+# Gives the same result as calling priceFirstOrderAdaptive on each state
+def priceFirstOrderAdaptiveAll(states: 'List[State]', price: float, alpha: float) -> None:
+    anchor, weight = alpha * price, 1 - alpha
+    for state in states:
+        state.aspiration = anchor + weight * state.aspiration
+
 # After a period is realized, all agents with that security calculate a new aspiration for this security based on its value
 # This is then stored in the backlog for when the same value of C arises in the future
 def dividendFirstOrderAdaptive(aspiration: float, dividend: int, beta: float) -> float:
@@ -35,22 +42,23 @@ def representativenessAdjustment2(state: 'State', epsilon: float, pattern: str)
     # Only enact change if there is a decreasing pattern
     if pattern != "decreasing":
         return state.aspiration
+    world = state.parent_world
+    uncertain = world.getUncertainStatesMap()
     # Only multiply other securities by the approriate factor when we have not already ruled out this state
-    if state.state_num in state.parent_world.getUncertainStates():
+    if state.state_num in uncertain:
         # print(f"Noticed decreasing pattern for {state.state_num}")
         # Rule out this state
-        state.parent_world.C -= 1
-        state.parent_world.removeUncertain(state.state_num)
-        newC = state.parent_world.C 
-        if newC != 0:
-            for other_state in state.parent_world.states.values():
-                # Only enact multiplier for states that are uncertain
-                if other_state is not state and other_state.state_num in state.parent_world.getUncertainStates():
-                    # There is only one security this agent is uncertain about, leading it to conclude it must be reaalized
-                    if newC == 1:
-                        other_state.updateAspiration(other_state.dividend)
-                    # Shouldn't increase the aspiration level beyond the payoff of the security 
-                    else:
-                        other_state.updateAspiration(min(state.aspiration * (state.parent_world.C + 1) / state.parent_world.C, state.dividend))
-                    # print(f"Changed security: {other_state.state_num} to aspiration: {other_state.aspiration}")
+        world.C -= 1
+        world.removeUncertain(state.state_num)
+        newC = world.C
+        # Only enact multiplier for states that are still uncertain, which no longer includes this state
+        # There is only one security this agent is uncertain about, leading it to conclude it must be reaalized
+        if newC == 1:
+            for state_num in uncertain:
+                world.states[state_num].updateAspiration(world.states[state_num].dividend)
+        # Shouldn't increase the aspiration level beyond the payoff of the security 
+        elif newC != 0:
+            aspiration = min(state.aspiration * (newC + 1) / newC, state.dividend)
+            for state_num in uncertain:
+                world.states[state_num].updateAspiration(aspiration)
     return epsilon if epsilon < state.aspiration else state.aspiration
\ No newline at end of file
@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from small_world import SmallWorld
+
+# Stored results that every run of the suite is compared against
+# Only metrics that do not depend on the speed of the machine are stored here, so the same baselines hold on every machine
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+# Timings and rates of the machine the suite is run on, stored next to the baselines by --update but never committed
+TIMING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_timings.json")
+# A metric regresses when it is this much worse than its baseline, relative to the baseline
+DEFAULT_TOLERANCE = .3
+# Every scenario is run this many times and its fastest run is kept, which filters out most noise from other processes
+DEFAULT_REPEATS = 3
+# Rates of scenarios that run for less than this many seconds vary too much from run to run to compare against their baseline
+MIN_TIMED_SECONDS = .5
+# Timings keep the fastest of DEFAULT_REPEATS runs, so rates are only compared when a scenario is run at least this many times too
+MIN_COMPARED_REPEATS = DEFAULT_REPEATS
+SEED = 0
+
+# Size of the large world and number of iterations for each market type
+SIZES = {
+    "small": {"N": 20, "S": 10, "K": 4, "num_periods": 3, "i": {1: 200000, 2: 15000}},
+    "medium": {"N": 200, "S": 50, "K": 10, "num_periods": 3, "i": {1: 100000, 2: 100}},
+    "large": {"N": 2000, "S": 200, "K": 20, "num_periods": 2, "i": {1: 20000, 2: 20}},
+}
+# Each variant changes the default configuration in one way
+VARIANTS = {
+    "default": {},
+    "unfixed": {"fix_num_states": False},
+    "rep2": {"rep_flag": 2},
+    "rep3": {"rep_flag": 3, "rep_threshold": 10},
+    "nobacklog": {"use_backlog": False},
+}
+# Whether a higher value of each metric is better
+# iterations_per_second and trades_per_second are wall clock rates, the others do not depend on the speed of the machine
+METRICS = {
+    "iterations_per_second": True,
+    "trades_per_second": True,
+    "peak_memory_mb": False,
+    "db_bytes": False,
+}
+# Metrics that are stored in the timing file instead of the baselines
+TIMED_METRICS = {"setup_seconds", "seconds", "iterations_per_second", "trades_per_second"}
+
+# Returns the name and parameters of every scenario of the given sizes
+def buildScenarios(sizes: 'List[str]') -> 'List[tuple]':
+    scenarios = []
+    for size in sizes:
+        for market_type in [1, 2]:
+            for variant, overrides in VARIANTS.items():
+                p = {
+                    "N": SIZES[size]["N"], "S": SIZES[size]["S"], "E": 5, "market_type": market_type,
+                    "fix_num_states": True, "K": SIZES[size]["K"], "by_midpoint": True, "pick_agent_first": True,
+                    "use_backlog": True, "rep_flag": 1, "num_periods": SIZES[size]["num_periods"],
+                    "i": SIZES[size]["i"][market_type], "r": 1, "alpha": .05, "beta": .15, "phi": 3,
+                    "epsilon": .05, "rho": 5, "is_custom": False, "num_trader_types": 1,
+                    "num_traders_by_type": [SIZES[size]["N"]], "seed": SEED,
+                }
+                p.update(overrides)
+                scenarios.append((f"{size}_type{market_type}_{variant}", p))
+    return scenarios
+
+# Runs a single scenario repeats times in a fresh process and returns the metrics of its fastest run
+# The simulation is written to a temporary directory that is removed afterwards
+def runScenario(args: tuple) -> tuple:
+    name, p, repeats = args
+    # LargeWorld is imported here so the parent process stays small and does not inflate the peak memory of a scenario
+    from large_world import LargeWorld
+    directory = tempfile.mkdtemp()
+    try:
+        p = dict(p, file_name=os.path.join(directory, name))
+        setup_seconds = seconds = float("inf")
+        for _ in range(repeats):
+            # Every run draws the same random numbers, so only its timing differs
+            random.seed(p["seed"])
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                L = LargeWorld(dict(p, num_traders_by_type=list(p["num_traders_by_type"])))
+                setup_seconds = min(setup_seconds, time.perf_counter() - start)
+                start = time.perf_counter()
+                L.simulate(p["num_periods"], p["i"], p["r"])
+                seconds = min(seconds, time.perf_counter() - start)
+        trades = L.db.num_rows.get("transactions", 0)
+        metrics = {
+            "setup_seconds": setup_seconds,
+            "seconds": seconds,
+            "iterations_per_second": p["num_periods"] * p["i"] / seconds,
+            "trades_per_second": trades / seconds,
+            # ru_maxrss is in KiB on Linux
+            "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "db_bytes": os.path.getsize(p["file_name"] + ".db"),
+        }
+    finally:
+        shutil.rmtree(directory)
+    return name, metrics
+
+# Returns whether a scenario ran long enough, both now and in its stored timings, for its rates to be compared
+def isTimed(metrics: dict, timings: dict) -> bool:
+    return min(metrics["seconds"], timings.get("seconds", 0)) >= MIN_TIMED_SECONDS
+
+# Returns a description of every metric of a scenario that is worse than its baseline by more than tolerance
+# Metrics without a baseline are not compared
+def findRegressions(name: str, metrics: dict, baseline: dict, tolerance: float) -> 'List[str]':
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        if metric not in baseline:
+            continue
+        value, expected = metrics[metric], baseline[metric]
+        if (value < expected * (1 - tolerance)) if higher_is_better else (value > expected * (1 + tolerance)):
+            regressions.append(f"{name} {metric}: {round(value, 1)}, baseline {round(expected, 1)}")
+    return regressions
+
+# Returns the stored results in a JSON file, or no results if it does not exist
+def loadResults(results_file: str) -> dict:
+    if not os.path.exists(results_file):
+        return {}
+    with open(results_file, "r") as f:
+        return json.load(f)
+
+# Runs every scenario of the given sizes one after the other, each in its own process
+# Compares them against the baselines in baseline_file and the timings of this machine in timing_file,
+# or stores them there if update is True
+# Returns the list of regressions
+def runBenchmarks(sizes: 'List[str]', baseline_file: str = BASELINE_FILE, tolerance: float = DEFAULT_TOLERANCE, update: bool = False, repeats: int = DEFAULT_REPEATS, timing_file: str = TIMING_FILE) -> 'List[str]':
+    baselines, timings = loadResults(baseline_file), loadResults(timing_file)
+
+    regressions = []
+    if not update:
+        if not timings:
+            print(f"Rates are not compared, store the timings of this machine in {timing_file} with --update first")
+        elif repeats < MIN_COMPARED_REPEATS:
+            print(f"Rates are not compared with fewer than {MIN_COMPARED_REPEATS} repeats")
+    # Spawned processes start from a clean interpreter, so the peak memory of a scenario is its own
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for name, metrics in pool.imap(runScenario, [(name, p, repeats) for name, p in buildScenarios(sizes)]):
+            print(f"{name}: {round(metrics['iterations_per_second'])} iterations/s, {round(metrics['trades_per_second'])} trades/s, "
+                  f"{round(metrics['peak_memory_mb'], 1)} MB peak, {metrics['db_bytes']} database bytes")
+            if update:
+                baselines[name] = {metric: value for metric, value in metrics.items() if metric not in TIMED_METRICS}
+                timings[name] = {metric: value for metric, value in metrics.items() if metric in TIMED_METRICS}
+                continue
+            if name not in baselines:
+                print(f"\tno baseline for {name}")
+            timed = name in timings and repeats >= MIN_COMPARED_REPEATS
+            if timed and not isTimed(metrics, timings[name]):
+                print(f"\trates of {name} not compared, it runs for less than {MIN_TIMED_SECONDS} seconds")
+                timed = False
+            regressions += findRegressions(name, metrics, {**baselines.get(name, {}), **(timings[name] if timed else {})}, tolerance)
+
+    if update:
+        for results_file, results in [(baseline_file, baselines), (timing_file, timings)]:
+            with open(results_file, "w") as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+        print(f"Stored baselines in {baseline_file} and the timings of this machine in {timing_file}")
+    return regressions
+
+# Returns the number of bytes allocated per agent-security by N small worlds that own K out of S securities each
+# Small worlds are given dividends and information like they are at the start of a period, so their per-period dicts are included
+# With array_storage, the small worlds keep their securities in a SecurityStorage like the vectorized engine does
+def memoryPerSecurity(N: int, S: int, K: int, array_storage: bool = False) -> float:
+    if array_storage:
+        # NumPy is only needed for array storage
+        from security_storage import SecurityStorage, ArraySmallWorld
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states_lists = [random.sample(range(S), K) for agent_num in range(N)]
+    if array_storage:
+        storage = SecurityStorage(states_lists, 5)
+        storage.dividend[:] = [random.random() for i in range(N * K)]
+        small_worlds = [ArraySmallWorld(agent_num, states_list, 5, storage, agent_num) for agent_num, states_list in enumerate(states_lists)]
+    else:
+        small_worlds = [SmallWorld(agent_num, states_list, 5) for agent_num, states_list in enumerate(states_lists)]
+        for sw in small_worlds:
+            for state in sw.getStateObjects():
+                state.setDividend(random.random())
+    for sw, states_list in zip(small_worlds, states_lists):
+        sw.giveNotInfo(states_list[:K // 2])
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / (N * K)
+
+# Usage: python benchmark.py [--sizes small,medium] [--tolerance 0.25] [--repeats 3] [--update] [--memory N S K]
+# Exits with status 1 if any metric regressed past the tolerance
+# Rates are only compared once --update has stored the timings of this machine
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the benchmark suite and compares it against the stored baselines")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated sizes out of {', '.join(SIZES)}")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file of baselines")
+    parser.add_argument("--timings", default=TIMING_FILE, help="JSON file of the timings of this machine")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="relative change of a metric that counts as a regression")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="number of runs of each scenario, the fastest of which is kept")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baselines and timings instead of comparing against them")
+    parser.add_argument("--memory", type=int, nargs=3, metavar=("N", "S", "K"), help="only measure the memory used per agent-security, with and without array storage")
+    args = parser.parse_args()
+
+    # Array storage exists to save memory, so it failing to use less than plain objects counts as a regression
+    if args.memory:
+        N, S, K = args.memory
+        footprints = {}
+        for array_storage in [False, True]:
+            random.seed(SEED)
+            footprints[array_storage] = memoryPerSecurity(N, S, K, array_storage)
+            print(f"{round(footprints[array_storage], 1)} bytes per agent-security {'with' if array_storage else 'without'} array storage with N={N}, S={S}, K={K}")
+        if footprints[True] >= footprints[False]:
+            print("Regressions:\n\tarray storage does not use less memory per agent-security than plain objects")
+            sys.exit(1)
+        sys.exit(0)
+
+    regressions = runBenchmarks(args.sizes.split(","), args.baseline, args.tolerance, args.update, args.repeats, args.timings)
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"\t{regression}")
+        sys.exit(1)
+    print("No regressions")
@@ -0,0 +1,147 @@
+import os
+import shutil
+import numpy as np
+import database_manager as dm
+
+# Column names and NumPy types of the tables stored in columnar format
+# Every other table is still stored in the SQLite database
+COLUMNAR_SCHEMAS = {
+    "transactions": [
+        ("period_num", np.int32),
+        ("iteration_num", np.int32),
+        ("state_num", np.int32),
+        ("transaction_num", np.int32),
+        ("buyer_id", np.int32),
+        ("seller_id", np.int32),
+        ("price", np.float64),
+        ("action", np.int8),
+        ("bid", np.float64),
+        ("buyer_aspiration", np.float64),
+        ("ask", np.float64),
+        ("seller_aspiration", np.float64),
+        ("spread", np.float64),
+    ],
+    "aspirations": [
+        ("period_num", np.int32),
+        ("agent_num", np.int32),
+        ("state_num", np.int32),
+        ("C", np.int32),
+        ("start_aspiration", np.float64),
+        ("not_info", np.int8),
+        ("backlog", np.int8),
+    ],
+    "security_balances": [
+        ("period_num", np.int32),
+        ("agent_num", np.int32),
+        ("state_num", np.int32),
+        ("amount", np.int32),
+        ("dividend", np.float64),
+        ("value", np.float64),
+        ("realized", np.int8),
+    ],
+    "realizations": [
+        ("period_num", np.int32),
+        ("state_num", np.int32),
+        ("realized", np.int8),
+    ],
+}
+
+# Returns the numbers of the segments stored for a table in order
+def segmentNums(table_directory: str) -> 'List[int]':
+    if not os.path.isdir(table_directory):
+        return []
+    return sorted(int(name) for name in os.listdir(table_directory) if name.isdigit())
+
+class ColumnarWriter(dm.DatabaseWriter):
+    # Attributes:
+    # directory: str                    directory holding one subdirectory for each table in COLUMNAR_SCHEMAS
+    # next_segment: dict{str: int}      number of the next segment to write for each table
+
+    # Writes the tables in COLUMNAR_SCHEMAS as chunks of typed NumPy columns instead of SQLite rows
+    # Each flush of a table writes one segment, a directory <directory>/<table>/<n> holding a <column>.npy file per column
+    # Segments are written under a temporary name and then renamed, so a crash never leaves half a segment behind
+    # If reset is True, any columns stored by an earlier simulation in directory are removed
+    def __init__(self, con, directory: str, reset: bool = True, buffer_size: int = dm.DEFAULT_BUFFER_SIZE):
+        dm.DatabaseWriter.__init__(self, con, buffer_size)
+        self.directory = directory
+        self.next_segment = {}
+        for table in COLUMNAR_SCHEMAS:
+            table_directory = os.path.join(directory, table)
+            if reset and os.path.isdir(table_directory):
+                shutil.rmtree(table_directory)
+            os.makedirs(table_directory, exist_ok=True)
+            segments = segmentNums(table_directory)
+            self.next_segment[table] = segments[-1] + 1 if segments else 0
+
+    def flushTable(self, table: str) -> None:
+        if table not in COLUMNAR_SCHEMAS:
+            dm.DatabaseWriter.flushTable(self, table)
+            return
+        rows = self.buffers.get(table)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        self.writeSegment(table, self.next_segment[table], {
+            column_name: np.array(column, dtype=dtype)
+            for (column_name, dtype), column in zip(COLUMNAR_SCHEMAS[table], columns)
+        })
+        self.next_segment[table] += 1
+        self.num_rows[table] = self.num_rows.get(table, 0) + len(rows)
+        self.buffers[table] = []
+
+    # Writes a dictionary linking each column of a table with its values as segment segment_num of that table
+    def writeSegment(self, table: str, segment_num: int, columns: dict) -> None:
+        segment_directory = os.path.join(self.directory, table, str(segment_num))
+        os.makedirs(segment_directory + ".tmp", exist_ok=True)
+        for column_name, values in columns.items():
+            np.save(os.path.join(segment_directory + ".tmp", column_name + ".npy"), values)
+        os.replace(segment_directory + ".tmp", segment_directory)
+
+    # Removes everything stored about the periods after period_num, both in columns and in the database
+    # Segments that contain later periods are rewritten without them
+    def deletePeriodsAfter(self, period_num: int) -> None:
+        dm.DatabaseWriter.deletePeriodsAfter(self, period_num)
+        reader = ColumnarReader(self.directory)
+        for table in COLUMNAR_SCHEMAS:
+            table_directory = os.path.join(self.directory, table)
+            for segment_num in segmentNums(table_directory):
+                segment = reader.readSegment(table, segment_num)
+                keep = segment["period_num"] <= period_num
+                if keep.all():
+                    continue
+                shutil.rmtree(os.path.join(table_directory, str(segment_num)))
+                if keep.any():
+                    self.writeSegment(table, segment_num, {column_name: values[keep] for column_name, values in segment.items()})
+
+class ColumnarReader:
+    # Attributes:
+    # directory: str        directory written by a ColumnarWriter
+
+    # Reads the columns written by a ColumnarWriter without decoding any rows
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    # Returns a dictionary linking each column of one segment of a table with its memory-mapped values
+    def readSegment(self, table: str, segment_num: int) -> dict:
+        segment_directory = os.path.join(self.directory, table, str(segment_num))
+        return {
+            column_name: np.load(os.path.join(segment_directory, column_name + ".npy"), mmap_mode="r")
+            for column_name, _ in COLUMNAR_SCHEMAS[table]
+        }
+
+    # Returns the memory-mapped values of a column in each segment of a table
+    def columnSegments(self, table: str, column_name: str) -> 'List[ndarray]':
+        table_directory = os.path.join(self.directory, table)
+        return [
+            np.load(os.path.join(table_directory, str(segment_num), column_name + ".npy"), mmap_mode="r")
+            for segment_num in segmentNums(table_directory)
+        ]
+
+    # Returns the full values of each of the columns of a table, only reading those columns
+    def readColumns(self, table: str, column_names: 'List[str]') -> 'List[ndarray]':
+        dtypes = dict(COLUMNAR_SCHEMAS[table])
+        columns = []
+        for column_name in column_names:
+            segments = self.columnSegments(table, column_name)
+            columns.append(np.concatenate(segments) if segments else np.zeros(0, dtype=dtypes[column_name]))
+        return columns
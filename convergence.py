@@ -0,0 +1,52 @@
+# Statistics a stopping rule can track across periods
+# mean_price            volume weighted mean transaction price across all securities
+# spread                volume weighted mean standard deviation of the transaction prices of each security
+# dividend_distance     volume weighted mean distance between the mean price of a security and what it paid out,
+#                       its mean dividend across agents if it was realized and 0 otherwise
+STOP_RULES = ["mean_price", "spread", "dividend_distance"]
+DEFAULT_STOP_TOLERANCE = .01
+DEFAULT_STOP_WINDOW = 5
+
+class ConvergenceRule:
+    # Attributes:
+    # rule: str                         statistic tracked across periods, one of STOP_RULES
+    # tolerance: float                  largest change of the statistic between two periods that still counts as stable
+    # window: int                       number of consecutive stable changes after which prices have converged
+    # dividends: dict{int: float}       mean dividend of each state number across the agents that own it
+    # history: List[float]              value of the statistic in each period so far, None for periods without any transactions
+
+    # Decides when the prices of a simulation have settled so it can stop before running every period
+    def __init__(self, rule: str, tolerance: float, window: int, dividends: dict):
+        if rule not in STOP_RULES:
+            raise ValueError(f"Stopping rule must be one of {STOP_RULES}")
+        self.rule = rule
+        self.tolerance = tolerance
+        self.window = window
+        self.dividends = dividends
+        self.history = []
+
+    # Returns the value of the statistic for the price statistics of a period and the states realized in it
+    # Returns None if there were no transactions in the period
+    def statistic(self, price_statistics: dict, R) -> float:
+        total_volume = sum(volume for _, _, volume in price_statistics.values())
+        if not total_volume:
+            return None
+        if self.rule == "mean_price":
+            values = {state_num: mean for state_num, (mean, _, _) in price_statistics.items()}
+        elif self.rule == "spread":
+            values = {state_num: st_dev for state_num, (_, st_dev, _) in price_statistics.items()}
+        else:
+            values = {
+                state_num: abs(mean - (self.dividends.get(state_num, 0) if state_num in R else 0))
+                for state_num, (mean, _, _) in price_statistics.items()
+            }
+        return sum(values[state_num] * volume for state_num, (_, _, volume) in price_statistics.items()) / total_volume
+
+    # Adds the statistic of a period to the history
+    # Returns True once the statistic changed by at most tolerance between each of the last window + 1 periods
+    def update(self, price_statistics: dict, R) -> bool:
+        self.history.append(self.statistic(price_statistics, R))
+        recent = self.history[-(self.window + 1):]
+        if len(recent) < self.window + 1 or None in recent:
+            return False
+        return all(abs(b - a) <= self.tolerance for a, b in zip(recent, recent[1:]))
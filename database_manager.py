@@ -1,3 +1,124 @@
+import sqlite3
+import time
+
+# Number of rows buffered for a single table before they are written to the database
+DEFAULT_BUFFER_SIZE = 10000
+# Size of the page cache in KiB, negative values tell SQLite to interpret cache_size in KiB rather than pages
+CACHE_SIZE_KIB = 65536
+PAGE_SIZE = 4096
+
+# Opens a connection to the database at database_name tuned for bulk writes
+# The connection runs in autocommit mode so that transactions are begun and committed explicitly by DatabaseWriter
+def connectDatabase(database_name: str) -> sqlite3.Connection:
+    con = sqlite3.connect(database_name, isolation_level=None)
+    setPragmas(con.cursor())
+    return con
+
+# Write-ahead logging lets readers look at a database while a simulation is writing to it
+# synchronous=NORMAL is safe in WAL mode, a crash can only lose the transaction currently being written
+def setPragmas(cur) -> None:
+    cur.execute(f"PRAGMA page_size={PAGE_SIZE}")
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+
+class DatabaseWriter:
+    # Attributes:
+    # con: Connection                       connection to database object
+    # cur: Cursor                           Cursor object to execute database commands
+    # buffers: dict{str: List[list]}        rows waiting to be inserted, keyed by table name
+    # buffer_size: int                      number of rows a table may buffer before it is flushed early
+    # num_rows: dict{str: int}              number of rows written to each table so far
+    # num_flushes: int                      number of times buffered rows were written, whether early or at a commit
+    # write_seconds: float                  seconds spent writing buffered rows and committing them so far
+
+    # Rows are accumulated per table and written with executemany
+    # Nothing is visible in the database until commit is called
+    def __init__(self, con: sqlite3.Connection, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.con = con
+        self.cur = con.cursor()
+        self.buffers = {}
+        self.buffer_size = buffer_size
+        self.num_rows = {}
+        self.num_flushes = 0
+        self.write_seconds = 0
+
+    # Opens a transaction that all following writes belong to until commit is called
+    def begin(self) -> None:
+        if not self.con.in_transaction:
+            self.cur.execute("BEGIN")
+
+    # Queue up a single row to be inserted into table
+    def insert(self, table: str, row) -> None:
+        buffer = self.buffers.setdefault(table, [])
+        buffer.append(row)
+        if len(buffer) >= self.buffer_size:
+            self.timedFlush(table)
+
+    # Queue up several rows to be inserted into table
+    def insertMany(self, table: str, rows) -> None:
+        buffer = self.buffers.setdefault(table, [])
+        buffer.extend(rows)
+        if len(buffer) >= self.buffer_size:
+            self.timedFlush(table)
+
+    # Flushes a table, counting the flush and the time it took
+    def timedFlush(self, table: str) -> None:
+        if not self.buffers.get(table):
+            return
+        start = time.perf_counter()
+        self.flushTable(table)
+        self.num_flushes += 1
+        self.write_seconds += time.perf_counter() - start
+
+    # Writes all the buffered rows of a table to the database in one executemany call
+    def flushTable(self, table: str) -> None:
+        rows = self.buffers.get(table)
+        if not rows:
+            return
+        self.begin()
+        placeholders = ", ".join(["?"] * len(rows[0]))
+        self.cur.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        self.num_rows[table] = self.num_rows.get(table, 0) + len(rows)
+        self.buffers[table] = []
+
+    def flush(self) -> None:
+        for table in list(self.buffers.keys()):
+            self.timedFlush(table)
+
+    # Writes everything that is buffered and commits the current transaction
+    # Called at the end of each period so that a crash only loses the period in progress
+    def commit(self) -> None:
+        self.flush()
+        if self.con.in_transaction:
+            start = time.perf_counter()
+            self.cur.execute("COMMIT")
+            self.write_seconds += time.perf_counter() - start
+
+    def close(self) -> None:
+        self.commit()
+        self.con.close()
+
+    # Removes everything stored about the periods after period_num
+    def deletePeriodsAfter(self, period_num: int) -> None:
+        deletePeriodsAfter(self.cur, period_num)
+
+# Tables that store information about each period of a simulation
+PERIOD_TABLES = ["transactions", "realizations", "agents", "security_balances", "aspirations", "prices_by_period", "perf"]
+
+# Returns the names of the tables in the database
+def tableNames(cur) -> 'Set[str]':
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cur.fetchall()}
+
+# Deletes everything stored about the periods after period_num
+def deletePeriodsAfter(cur, period_num: int) -> None:
+    tables = tableNames(cur)
+    for table in PERIOD_TABLES:
+        if table in tables:
+            cur.execute(f"DELETE FROM {table} WHERE period_num > ?", (period_num,))
+
 def createTransactionsTable(cur) -> None:
     cur.execute("DROP TABLE IF EXISTS transactions")
     cur.execute('''
@@ -29,10 +150,8 @@ def createRealizationsTable(cur) -> None:
         )
     ''')
 
-def updateRealizationsTable(cur, period_num: int, S: int, R) -> None:
-    for state_num in range(S):
-        cur.execute("INSERT INTO realizations VALUES (?, ?, ?)",
-                    [period_num, state_num, 1 if state_num in R else 0])
+def updateRealizationsTable(db: DatabaseWriter, period_num: int, S: int, R) -> None:
+    db.insertMany("realizations", [[period_num, state_num, 1 if state_num in R else 0] for state_num in range(S)])
 
 def createAgentsTable(cur) -> None:
     cur.execute("DROP TABLE IF EXISTS agents")
@@ -49,12 +168,13 @@ def createAgentsTable(cur) -> None:
     ''')
 
 # small_worlds: List[SmallWorld]
-def updateAgentsTable(cur, period_num: int, small_worlds) -> None:
+def updateAgentsTable(db: DatabaseWriter, period_num: int, small_worlds) -> None:
+    rows = []
     for sw in small_worlds:
-        states = ",".join(map(str, sw.states.keys()))
-        not_info = ",".join(map(str, sw.not_info))
-        cur.execute("INSERT INTO agents VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    [period_num, sw.agent_num, sw.num_states, sw.balance, states, not_info, sw.C])
+        states = ",".join(map(str, sw.getStateNums()))
+        not_info = ",".join(map(str, sorted(sw.not_info)))
+        rows.append([period_num, sw.agent_num, sw.num_states, sw.balance, states, not_info, sw.C])
+    db.insertMany("agents", rows)
 
 def createPricesByPeriodTable(cur) -> None:
     cur.execute("DROP TABLE IF EXISTS prices_by_period")
@@ -69,6 +189,10 @@ def createPricesByPeriodTable(cur) -> None:
         )
     ''')
 
+# Securities that never traded are left out of prices_by_period, just like simulation_statistics does
+def deleteUntradedPricesByPeriod(cur) -> None:
+    cur.execute("DELETE FROM prices_by_period WHERE state_num NOT IN (SELECT state_num FROM prices_by_period WHERE volume > 0)")
+
 def createPricesByTransactionTable(cur) -> None:
     cur.execute("DROP TABLE IF EXISTS prices_by_transaction")
     cur.execute('''
@@ -81,6 +205,12 @@ def createPricesByTransactionTable(cur) -> None:
         )
     ''')
 
+# Indexes used by simulation_statistics to read the prices of a security grouped by period or by transaction number
+# Price is included so that both indexes cover their queries without touching the table itself
+def createTransactionsIndexes(cur) -> None:
+    cur.execute("CREATE INDEX IF NOT EXISTS transactions_by_period ON transactions (state_num, period_num, price)")
+    cur.execute("CREATE INDEX IF NOT EXISTS transactions_by_transaction ON transactions (state_num, transaction_num, price)")
+
 def createSecurityBalancesTable(cur) -> None:
     cur.execute("DROP TABLE IF EXISTS security_balances")
     cur.execute('''
@@ -120,6 +250,91 @@ def createDividendsTable(cur) -> None:
         )
     ''')
 
+# Stores the time spent in each phase of each period and the counters of that period
+# kind is either 'seconds' or 'count'
+def createPerfTable(cur) -> None:
+    cur.execute("DROP TABLE IF EXISTS perf")
+    cur.execute('''
+        CREATE TABLE perf (
+            period_num INT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
+
+# Stores the stopping rule of a simulation that stops once its prices have converged
+# stop_period is the period after which the simulation stopped, or NULL if it ran every period
+def createStoppingTable(cur) -> None:
+    cur.execute("DROP TABLE IF EXISTS stopping")
+    cur.execute('''
+        CREATE TABLE stopping (
+            rule TEXT NOT NULL,
+            tolerance REAL NOT NULL,
+            window_size INT NOT NULL,
+            statistic REAL,
+            stop_period INT
+        )
+    ''')
+
+# Replaces the row of the stopping table, which is rewritten when a simulation is resumed
+def updateStoppingTable(db: DatabaseWriter, cur, rule, stop_period: int) -> None:
+    cur.execute("DELETE FROM stopping")
+    db.insert("stopping", [rule.rule, rule.tolerance, rule.window, rule.history[-1] if rule.history else None, stop_period])
+
+# Stores the seed and database of each replication of an input file
+def createReplicationsTable(cur) -> None:
+    cur.execute("DROP TABLE IF EXISTS replications")
+    cur.execute('''
+        CREATE TABLE replications (
+            replication_num INT NOT NULL,
+            seed INT NOT NULL,
+            db_name TEXT NOT NULL
+        )
+    ''')
+
+# Stores the prices_by_period statistics of a security in a period across all replications
+# mean and volume are averaged across replications and come with the bounds of their confidence interval
+def createReplicationSummaryTable(cur) -> None:
+    cur.execute("DROP TABLE IF EXISTS replication_summary")
+    cur.execute('''
+        CREATE TABLE replication_summary (
+            state_num INT NOT NULL,
+            period_num INT NOT NULL,
+            num_replications INT NOT NULL,
+            mean REAL,
+            mean_ci_low REAL,
+            mean_ci_high REAL,
+            st_dev REAL,
+            volume REAL NOT NULL,
+            volume_ci_low REAL NOT NULL,
+            volume_ci_high REAL NOT NULL,
+            realized REAL
+        )
+    ''')
+
+# Manifest of the jobs in a parameter sweep, with one column for each swept parameter
+# The table is kept if it already exists so that an interrupted sweep can be resumed
+# Raises a ValueError if the existing table sweeps other parameters, since its jobs would not match the sweep
+def createSweepJobsTable(cur, param_names: 'List[str]') -> None:
+    if "sweep_jobs" in tableNames(cur):
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(sweep_jobs)")]
+        existing = columns[1:-5]
+        if existing != list(param_names):
+            raise ValueError(f"The sweep_jobs manifest sweeps {existing} instead of {list(param_names)}, remove it or rename the sweep file to start a new sweep")
+    param_columns = "".join(f"{param_name}, " for param_name in param_names)
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS sweep_jobs (
+            job_name TEXT PRIMARY KEY,
+            {param_columns}
+            replication_num INT NOT NULL,
+            seed INT NOT NULL,
+            db_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            seconds REAL
+        )
+    ''')
+
 def createSimulationTables(cur) -> None:
     # Creates various tables to store information about simulation in database
     createDividendsTable(cur)
@@ -127,4 +342,7 @@ def createSimulationTables(cur) -> None:
     createAgentsTable(cur)
     createRealizationsTable(cur)
     createSecurityBalancesTable(cur)
-    createAspirationsTable(cur)
\ No newline at end of file
+    createAspirationsTable(cur)
+    # The perf and stopping tables are only created when a simulation uses them, so ones left by a previous simulation are removed here
+    cur.execute("DROP TABLE IF EXISTS perf")
+    cur.execute("DROP TABLE IF EXISTS stopping")
\ No newline at end of file
@@ -0,0 +1,44 @@
+import numpy as np
+
+# Number of iterations whose random decisions are drawn at once
+BLOCK_SIZE = 65536
+
+# Builds the alias table of a discrete distribution with Vose's method
+# Returns the probability of keeping each outcome and the outcome it is otherwise replaced by
+def aliasTable(weights: 'ndarray') -> tuple:
+    n = len(weights)
+    scaled = weights * n / weights.sum()
+    prob = np.ones(n)
+    alias = np.arange(n)
+    small = [k for k in range(n) if scaled[k] < 1]
+    large = [k for k in range(n) if scaled[k] >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] -= 1 - scaled[s]
+        (small if scaled[l] < 1 else large).append(l)
+    return prob, alias
+
+class IterationStream:
+    # Attributes:
+    # securities: List[State]       every security that can be picked in an iteration
+    # prob: ndarray[float]          alias table probability of keeping each security
+    # alias: ndarray[int]           alias table security each security is otherwise replaced by
+    # rng: Generator                NumPy random number generator all decisions are drawn from
+
+    # Draws the random decisions of market type 1 iterations in blocks instead of one call at a time
+    # groups holds the securities an iteration picks from in two steps, a random group and then a random security of that group,
+    # so each security is picked with probability 1 / (number of groups * size of its group) in a single alias table draw
+    def __init__(self, groups: 'List[List[State]]', seed: int):
+        self.securities = [state for group in groups for state in group]
+        weights = np.concatenate([np.full(len(group), 1 / len(group)) for group in groups])
+        self.prob, self.alias = aliasTable(weights)
+        self.rng = np.random.default_rng(seed)
+
+    # Draws the decisions of the next num_iterations iterations
+    # Returns lists of the picked securities, whether each one bids instead of asks and the uniform its price is drawn with
+    def drawBlock(self, num_iterations: int) -> tuple:
+        picks = self.rng.integers(0, len(self.securities), num_iterations)
+        picks = np.where(self.rng.random(num_iterations) < self.prob[picks], picks, self.alias[picks])
+        securities = self.securities
+        return [securities[k] for k in picks.tolist()], (self.rng.random(num_iterations) < .5).tolist(), self.rng.random(num_iterations).tolist()
@@ -1,5 +1,8 @@
 import random
-import sqlite3
+import os
+import pickle
+from itertools import chain
+from math import log
 from small_world import SmallWorld
 from market_table import MarketTable
 from market_table2 import MarketTable2
@@ -7,6 +10,44 @@ from agent_intelligence import dividendFirstOrderAdaptive
 import database_manager as dm
 
 REPRESENTATIVENESS_MAX_PROBABILITY = .1
+ACTIONS = ("bid", "ask")
+
+# Reads in a checkpoint written by LargeWorld.writeCheckpoint
+def loadCheckpoint(checkpoint_file: str) -> dict:
+    with open(checkpoint_file, "rb") as f:
+        return pickle.load(f)
+
+# Yields, in increasing order, the positions in range(n) that succeed when each position is an independent trial with probability p
+# Jumps from one success straight to the next with a geometric draw, so it costs one random number per success instead of one per trial
+def bernoulliSuccesses(n: int, p: float):
+    if p <= 0:
+        return
+    log_q = log(1 - p)
+    pos = -1
+    while True:
+        pos += int(log(1 - random.random()) / log_q) + 1
+        if pos >= n:
+            return
+        yield pos
+
+# Returns an array with a row of k distinct numbers out of range(n), in random order, for each of num_rows rows
+# Uses Floyd's algorithm on many rows at once, which draws k numbers per row
+# Rows are sampled in chunks, so the table of the numbers each row has already taken stays around 16 MB
+def bulkSample(rng, num_rows: int, n: int, k: int) -> 'ndarray':
+    import numpy as np
+    chosen = np.empty((num_rows, k), dtype=np.int64)
+    chunk_size = max(1, (1 << 24) // max(n, 1))
+    for start in range(0, num_rows, chunk_size):
+        block = chosen[start:start + chunk_size]
+        rows = np.arange(len(block))
+        taken = np.zeros((len(block), n), dtype=bool)
+        for col, j in enumerate(range(n - k, n)):
+            draws = rng.integers(0, j + 1, size=len(block))
+            # A number that was already taken in a row is replaced by j, which can not have been taken yet
+            draws = np.where(taken[rows, draws], j, draws)
+            taken[rows, draws] = True
+            block[:, col] = draws
+    return rng.permuted(chosen, axis=1)
 
 class LargeWorld:
     # Attributes:
@@ -15,21 +56,46 @@ class LargeWorld:
     # E: float                                  endowment of each security in each small world
     # L: List[int]                              union of states in small worlds
     # small_worlds: dict{int:SmallWorld}        dictionary of key agent numbers and value SmallWorld objects
+    # reserves: dict{int: List[State]}          securities of every agent grouped by state number, in the order of agents, which markets use as their reserve
+    #                                           None with array storage, whose engines find the securities of a market in storage
+    # agents: List[SmallWorld]                  the SmallWorld objects of small_worlds, built once so iterations do not rebuild the list
+    # securities: List[State]                   every security of every agent, grouped by agent in the order of agents, None with array storage
+    # num_securities: int                       number of securities across all agents
+    # iteration: function                       conducts one iteration given its number, built once by buildIterationPlan for the configuration of this large world
+    # block_random: bool                        if True, the random decisions of market type 1 iterations are drawn in blocks from a NumPy generator
+    # stream: IterationStream                   draws those blocks, None unless block_random is set
+    # perf: PerfRecorder                        records the time spent in each phase of a period and stores it in the perf table, None unless record_perf is set
     # market_table: MarketTable                 our market making mechanism
     # use_backlog: bool                         if we should use a backlog
+    # backlog_capacity: int                     most info_keys each agent keeps in its backlog, None for no limit
     # pick_agent_first: bool                    if True, we randomly pick an agent then a state in an iteration.
     #                                           if False, we randomly pick a state then an agent
     # con: Connection                           connection to database object
     # cur: Cursor                               Cursor object to execute database commands
+    # db: DatabaseWriter                        buffered writer that all simulation rows are inserted through
     # beta: float                               beta for post-period first order adaptive process
     # rep_threshold: int                        Either None if representativeness module is 1 or 2
     #                                           Or if it is module 3, its value is the iteration to start applying the representativeness heuristic
     # market_type: int                          The type of market
+    # vectorized: bool                          if True, market type 2 runs on the NumPy engine in VectorMarketTable2
+    # parallel_workers: int                     number of worker processes market type 2 splits its markets across with ParallelMarketTable2, 0 to run them in this process
+    # array_storage: bool                       if True, agents and securities live in the NumPy arrays of a SecurityStorage, only used by the NumPy engines
+    # storage: SecurityStorage                  arrays backing every agent and security, None unless array_storage is set
+    # checkpoint_interval: int                  number of periods between checkpoints, None or 0 to never write one
+    # checkpoint_file: str                      where checkpoints are written, <file_name>.ckpt
+    # start_period: int                         first period simulate runs, later than 0 when resuming from a checkpoint
+    # online_statistics: bool                   if True, markets store the price statistics of each period in prices_by_period as they go
+    # columnar_results: bool                    if True, the largest tables are stored as NumPy columns in <file_name>.columns instead of the database
+    # stop_rule: str                            statistic of the stopping rule that ends the simulation once prices converge, None to run every period
+    # convergence: ConvergenceRule              tracks that statistic across periods, None unless stop_rule is set
 
     # Variables used during the conduction of the simulation
     # period_num            Current period number
-    # iteration_num         Current iteration number
-    # R                     Realized states for the current period
+    # iteration_num         Current iteration number of market type 2
+    # num_iterations        Number of iterations in the current period
+    # R                     Set of realized states for the current period
+    # price_statistics      Dictionary linking each state number with the mean, standard deviation and volume of its prices in the current period
+    # stop_period           Period after which the stopping rule ended the simulation, None if it has not
 
     # Print all inputs received for debugging purposes
     def printInputs(self, p: dict):
@@ -38,22 +104,66 @@ class LargeWorld:
             print(f"{var_name} : {var}")
 
     def initializeDatabase(self, database_name: str) -> None:
-        self.con = sqlite3.connect(database_name)
+        self.con = dm.connectDatabase(database_name)
         self.cur = self.con.cursor()
         dm.createSimulationTables(self.cur)
+        if self.online_statistics:
+            dm.createPricesByPeriodTable(self.cur)
+        if self.perf is not None:
+            dm.createPerfTable(self.cur)
+        if self.stop_rule:
+            dm.createStoppingTable(self.cur)
+        self.db = self.createWriter(database_name, True)
+        if self.perf is not None:
+            self.perf.watch(self.db)
+
+    # Opens the database of a simulation that is resumed after period_num
+    # Anything stored about later periods was written after the checkpoint and is removed
+    def reopenDatabase(self, database_name: str, period_num: int) -> None:
+        self.con = dm.connectDatabase(database_name)
+        self.cur = self.con.cursor()
+        # The simulation may not have recorded its performance before it was interrupted
+        if self.perf is not None and "perf" not in dm.tableNames(self.cur):
+            dm.createPerfTable(self.cur)
+        if self.stop_rule and "stopping" not in dm.tableNames(self.cur):
+            dm.createStoppingTable(self.cur)
+        self.db = self.createWriter(database_name, False)
+        if self.perf is not None:
+            self.perf.watch(self.db)
+        self.db.begin()
+        self.db.deletePeriodsAfter(period_num)
+        self.db.commit()
+
+    # Returns the writer that all rows of the simulation go through
+    # With columnar results, the columns of a previous simulation are removed if reset is True
+    def createWriter(self, database_name: str, reset: bool) -> 'DatabaseWriter':
+        if self.columnar_results:
+            # NumPy is only needed for columnar results
+            from columnar_storage import ColumnarWriter
+            return ColumnarWriter(self.con, database_name[:-3] + ".columns", reset)
+        return dm.DatabaseWriter(self.con)
 
     def initializeMarket(self, p: dict) -> None:
         # Set up market
         # Only include the states that are owned by some agents in marketplace
         if self.market_type == 1:
-            self.market_table = MarketTable(self.L, self.small_worlds, p["by_midpoint"], self.cur, p["alpha"], p["phi"], p["epsilon"], p["rep_flag"])
+            self.market_table = MarketTable(self.L, self.reserves, p["by_midpoint"], self.db, p["alpha"], p["phi"], p["epsilon"], p["rep_flag"], self.online_statistics)
+        elif self.parallel_workers:
+            from parallel_market_table2 import ParallelMarketTable2
+            self.market_table = ParallelMarketTable2(self.L, self.small_worlds, p["by_midpoint"], self.db, p["alpha"], self.storage, self.online_statistics, self.parallel_workers)
+        elif self.vectorized:
+            # NumPy is only needed for the vectorized engine
+            from vector_market_table2 import VectorMarketTable2
+            self.market_table = VectorMarketTable2(self.L, self.small_worlds, p["by_midpoint"], self.db, p["alpha"], self.storage, self.online_statistics)
         elif self.market_type == 2:
-            self.market_table = MarketTable2(self.L, self.small_worlds, p["by_midpoint"], self.cur, p["alpha"])
+            self.market_table = MarketTable2(self.L, self.reserves, p["by_midpoint"], self.db, p["alpha"], self.online_statistics)
 
-    def initializeDividends(self, p: dict) -> None:
+    # Dividends are only stored in the database if store is True, they are already there when resuming
+    def initializeDividends(self, p: dict, store: bool = True) -> None:
         # Set up the dividend of agents
         # i is a counter that represents the trader type of the current agent we are iterating through
         i = 0
+        rows = []
         for agent_num, agent in self.small_worlds.items():
             # If there are heterogenous dividend payoffs
             if p["is_custom"]:
@@ -62,16 +172,116 @@ class LargeWorld:
                     i+=1
                 p["num_traders_by_type"][i] -= 1
             trader_type = i
-            for state_num, state in agent.states.items():
-                # Lookup the dividend we need from our dividends data structure
-                # Otherwise, it is 1 by default
-                dividend = p[trader_type][state_num] if p["is_custom"] else 1
-                state.setDividend(dividend)
-                # Store the dividend of each agent for each security in database
-                self.cur.execute("INSERT INTO dividends VALUES (?, ?, ?, ?)", [agent_num, trader_type, state_num, dividend])
+            # Lookup the dividend we need from our dividends data structure
+            # Otherwise, it is 1 by default
+            dividends = p[trader_type] if p["is_custom"] else None
+            for state_num in agent.getStateNums():
+                rows.append((agent_num, trader_type, state_num, dividends[state_num] if dividends is not None else 1))
+        # Rows are in the same order as securities, which is also how a SecurityStorage lays them out, so its dividends are set at once
+        if self.storage is not None:
+            self.storage.dividend[:] = [row[3] for row in rows]
+        else:
+            for state, row in zip(self.securities, rows):
+                state.setDividend(row[3])
+        # Store the dividend of each agent for each security in database
+        if store:
+            self.db.insertMany("dividends", rows)
+
+    # Sets up the rule that stops the simulation once its prices have converged
+    # The dividend a security is compared against is the mean dividend of the agents that own it
+    def initializeConvergence(self, p: dict) -> None:
+        from convergence import ConvergenceRule, DEFAULT_STOP_TOLERANCE, DEFAULT_STOP_WINDOW
+        dividends = {}
+        if self.storage is not None:
+            pairs = zip(self.storage.state_nums.tolist(), self.storage.dividend.tolist())
+        else:
+            pairs = ((state.state_num, state.getDividend()) for state in self.securities)
+        for state_num, dividend in pairs:
+            dividends.setdefault(state_num, []).append(dividend)
+        self.convergence = ConvergenceRule(
+            self.stop_rule,
+            p.get("stop_tolerance", DEFAULT_STOP_TOLERANCE),
+            p.get("stop_window", DEFAULT_STOP_WINDOW),
+            {state_num: sum(values) / len(values) for state_num, values in dividends.items()}
+        )
+
+    # Creates a small world for each agent from the states it has been assigned
+    # With array storage, the balances and securities of all agents live in a single SecurityStorage
+    def createSmallWorlds(self, states_lists: dict) -> None:
+        if self.array_storage:
+            # NumPy is only needed for array storage
+            from security_storage import SecurityStorage, ArraySmallWorld
+            # Worker processes of the parallel engine need the storage in shared memory
+            import multiprocessing
+            context = multiprocessing.get_context("spawn") if self.parallel_workers else None
+            self.storage = SecurityStorage(list(states_lists.values()), self.E, context)
+            for agent_pos, (agent_num, states_list) in enumerate(states_lists.items()):
+                self.small_worlds[agent_num] = ArraySmallWorld(agent_num, states_list, self.E, self.storage, agent_pos, self.backlog_capacity)
+        else:
+            self.storage = None
+            for agent_num, states_list in states_lists.items():
+                self.small_worlds[agent_num] = SmallWorld(agent_num, states_list, self.E, backlog_capacity=self.backlog_capacity)
+        self.agents = list(self.small_worlds.values())
+        self.num_securities = sum(agent.num_states for agent in self.agents)
+        # Building a list of every security would create the very objects array storage does without
+        if self.storage is not None:
+            self.securities = self.reserves = None
+            return
+        self.securities = [state for agent in self.agents for state in agent.states.values()]
+        self.reserves = {state_num: [] for state_num in self.L}
+        for state in self.securities:
+            self.reserves[state.state_num].append(state)
+
+    # Randomly assigns states to each agent and sets L and N accordingly
+    # Returns a dictionary linking each agent number with the states in its small world
+    # With bulk_setup, all samples are drawn at once from a NumPy generator instead of one random.sample at a time
+    def generateStates(self, p: dict) -> dict:
+        bulk = p.get("bulk_setup", False)
+        if bulk:
+            # NumPy is only needed for bulk setup
+            import numpy as np
+            # Seed from the global random state so that seeding random reproduces a run
+            rng = np.random.default_rng(random.getrandbits(64))
+        # If we fix the number of states, each world get K states
+        if p["fix_num_states"]:
+            self.N = p["N"]
+            # Go through each agent and give them a random sample of size K securities
+            if bulk:
+                states_lists = dict(enumerate(bulkSample(rng, self.N, self.S, p["K"]).tolist()))
+            else:
+                states_lists = {agent_num: random.sample(range(self.S), p["K"]) for agent_num in range(self.N)}
+            # All the states that are in the large world are put in L
+            self.L = sorted(set(chain.from_iterable(states_lists.values())))
+            return states_lists
+
+        # We instead fix the number of worlds that contain each state
+        self.L = range(self.S)
+        # states_list is an array with the states in each of the N agents
+        states_list = [[] for _ in range(p["N"])]
+        # Assign a random sample of K agents to each state
+        if bulk:
+            small_worlds = bulkSample(rng, self.S, p["N"], p["K"]).ravel()
+            # Sorting the (state, agent) pairs by agent keeps the states of each agent in increasing order
+            order = np.argsort(small_worlds, kind="stable")
+            state_nums = (order // p["K"]).tolist()
+            pos = 0
+            for agent_num, count in enumerate(np.bincount(small_worlds, minlength=p["N"]).tolist()):
+                states_list[agent_num] = state_nums[pos:pos + count]
+                pos += count
+        else:
+            for state_num in range(self.S):
+                for agent_num in random.sample(range(p["N"]), p["K"]):
+                    states_list[agent_num].append(state_num)
+        # There is a possibility that an agent gets assigned no states
+        # In this case, it is excluded from the large world
+        # We only create an agent object for those with at least 1 state
+        states_lists = {agent_num: states for agent_num, states in enumerate(states_list) if states}
+        self.N = len(states_lists)
+        return states_lists
 
     # Initialize large world based on the parameters in input file
-    def __init__(self, p: dict):
+    # If checkpoint_file is given, the large world instead picks up the simulation where that checkpoint left off
+    def __init__(self, p: dict, checkpoint_file: str = None):
         self.printInputs(p)
 
         # Error checking to make sure some of our inputs are valid
@@ -85,50 +295,64 @@ class LargeWorld:
         self.S, self.E, self.beta = p["S"], p["E"], p["beta"]
         self.pick_agent_first = p["pick_agent_first"]
         self.use_backlog = p["use_backlog"]
+        self.backlog_capacity = p.get("backlog_capacity") or None
         self.small_worlds = {}
         # rep_threhold could be None in which case it means the rep module is not 3
         self.rep_threshold = p.get("rep_threshold")
         self.market_type = p["market_type"]
         self.rho = p["rho"]
+        # The vectorized engine only exists for market type 2
+        self.vectorized = p.get("vectorized", False) and self.market_type == 2
+        # The parallel engine is a sharded version of the vectorized engine, and its workers share the arrays of a SecurityStorage
+        self.parallel_workers = (p.get("parallel_workers") or 0) if self.market_type == 2 else 0
+        if self.parallel_workers:
+            import multiprocessing
+            # Pool workers of replications and sweeps are daemonic, and daemonic processes can not start worker processes of their own
+            if multiprocessing.current_process().daemon:
+                raise ValueError("parallel_workers can not be used inside a replication or sweep worker process, run the simulation on its own instead")
+            self.vectorized = True
+        # Block random streams only exist for market type 1
+        self.block_random = p.get("block_random", False) and self.market_type == 1
+        self.stream = None
+        # Array storage keeps no object per security, which only the NumPy engines can do without, every other engine works on State objects
+        self.array_storage = p.get("array_storage", False) and self.vectorized or bool(self.parallel_workers)
+        self.online_statistics = p.get("online_statistics", False)
+        self.columnar_results = p.get("columnar_results", False)
+        if p.get("record_perf", False):
+            from perf_recorder import PerfRecorder
+            self.perf = PerfRecorder()
+        else:
+            self.perf = None
+        self.stop_rule = p.get("stop_rule")
+        self.convergence = None
 
-        # If we fix the number of states, each world get K states
-        if p["fix_num_states"]:
-            self.N = p["N"]
-            d = {}
-            # Go through each agent and give them a random sample of size K securities
-            # This agent is then added to the storage of small worlds
-            for agent_num in range(self.N):
-                agent = SmallWorld(agent_num, random.sample(range(self.S), p["K"]), self.E)
-                for state_num in agent.states.keys():
-                    if not d.get(state_num):
-                        d[state_num] = True
-                self.small_worlds[agent_num] = agent
-            # All the states that are in the large world are put in L
-            self.L = list(d.keys())
-            self.L.sort()
-        # We instead fix the number of worlds that contain each state
+        self.checkpoint_interval = p.get("checkpoint_interval")
+        self.checkpoint_file = p["file_name"] + ".ckpt"
+        self.start_period = 0
+        checkpoint = loadCheckpoint(checkpoint_file) if checkpoint_file else None
+
+        # When resuming, the agents are rebuilt from the checkpoint instead of drawn at random again
+        if checkpoint is None:
+            states_lists = self.generateStates(p)
         else:
-            # states_list is an array with the states in each of the N agents
-            self.L = range(self.S)
-            states_list = []
-            [states_list.append([]) for i in range(p["N"])]
-            # Assign a random sample of K agents to each state
-            for state_num in range(self.S):
-                random_small_worlds = random.sample(range(p["N"]), p["K"])
-                [states_list[i].append(state_num) for i in random_small_worlds]
-            for agent_num in range(p["N"]):
-                # There is a possibility that an agent gets assigned no states
-                # In this case, it is excluded from the large world
-                # We only create an agent object for those with at least 1 state
-                if states_list[agent_num]:
-                    agent = SmallWorld(agent_num, states_list[agent_num], self.E)
-                    self.small_worlds[agent_num] = agent
-            self.N = len(self.small_worlds)
+            states_lists, self.L = checkpoint["states_lists"], checkpoint["L"]
+            self.N = len(states_lists)
+        # These agents are then added to the storage of small worlds
+        self.createSmallWorlds(states_lists)
 
         # Set up database
-        self.initializeDatabase(p["file_name"] + ".db")
+        if checkpoint is None:
+            self.initializeDatabase(p["file_name"] + ".db")
+        else:
+            self.reopenDatabase(p["file_name"] + ".db", checkpoint["period_num"])
         self.initializeMarket(p)
-        self.initializeDividends(p)   
+        self.buildIterationPlan()
+        self.initializeDividends(p, checkpoint is None)
+        self.db.commit()
+        if self.stop_rule:
+            self.initializeConvergence(p)
+        if checkpoint is not None:
+            self.restoreCheckpoint(checkpoint)
 
     # String representation of large world and the small worlds and state within it
     # Used for testing purposes
@@ -141,8 +365,8 @@ class LargeWorld:
     # Based on the states that are realized, give partial information to a trader 
     # Out of the unrealized states, tell them roughly half of them
     def informTrader(self, trader: 'SmallWorld') -> None:
-        states = list(trader.states.keys())
-        not_realized_states = list(filter(lambda s: s not in self.R, states))
+        states = trader.getStateNums()
+        not_realized_states = [s for s in states if s not in self.R]
         # Initialize not_info by randomly choosing half of the agent's states not included in R
         not_info = random.sample(not_realized_states, len(not_realized_states) // 2)
         # Give this information to the current agent
@@ -150,7 +374,8 @@ class LargeWorld:
 
     # Initialize the aspiration of a security for a trader based on the information it has received
     # for that period
-    def initializeAspiration(self, trader: 'SmallWorld', state: 'State') -> None:
+    # lookup is the backlogged aspiration of the security, -1 if the backlog search came back empty-handed
+    def initializeAspiration(self, trader: 'SmallWorld', state: 'State', lookup: float = -1) -> None:
         # If the agent knows a state is not realized, its aspiration will be 0
         if state.getStateNum() in trader.getNotInfo():
             trader.getStatesMap()[state.getStateNum()].updateAspiration(0)
@@ -159,9 +384,6 @@ class LargeWorld:
         # If this simulation is using the backlog mechanism
         elif self.use_backlog:
             is_not_info = 0
-            # Search the backlog
-            # If it returns -1, it means that the backlog search came back empty-handed
-            lookup = state.aspirationBacklogLookup()
             if lookup == -1:
                 # If there is no backlog entry, aspiration is set to expected value assuming only state is realized
                 # ie. dividend payoff divided by the number of uncertain states
@@ -177,7 +399,7 @@ class LargeWorld:
             is_backlog = 0
         is_not_info = 0
         # Store initial aspirations levels in aspirations table of our databae
-        self.cur.execute("INSERT INTO aspirations VALUES (?, ?, ?, ?, ?, ?, ?)",
+        self.db.insert("aspirations",
                         [
                             self.period_num, 
                             trader.getAgentNum(), 
@@ -191,18 +413,60 @@ class LargeWorld:
 
     # Initialize each agent's aspiration for their securities at the beginning of a period
     def giveMinimalIntelligence(self) -> None:
+        if self.storage is not None:
+            self.giveArrayMinimalIntelligence()
+            return
         # Iterate through each agent:
         for small_world in self.small_worlds.values():
             # Give partial information to an agent
             self.informTrader(small_world)
-            for state in small_world.getStateObjects():
+            # Every security of an agent is backlogged under the same information, so the backlog is searched once per agent
+            backlog = small_world.aspirationBacklogLookup() if self.use_backlog else None
+            for pos, state in enumerate(small_world.getStateObjects()):
                 # Initialize aspiration for our security for this security
-                self.initializeAspiration(small_world, state)
+                self.initializeAspiration(small_world, state, backlog[pos] if backlog is not None else -1)
+
+    # Same as giveMinimalIntelligence and initializeAspiration for securities in a SecurityStorage
+    # Agents are informed one at a time, then every aspiration is set and stored at once
+    def giveArrayMinimalIntelligence(self) -> None:
+        # NumPy is only needed for array storage
+        import numpy as np
+        storage = self.storage
+        # Backlogged aspirations of the agents that have any, keyed by position in agents
+        backlogs = {}
+        for agent_pos, small_world in enumerate(self.agents):
+            self.informTrader(small_world)
+            backlog = small_world.aspirationBacklogLookup() if self.use_backlog else None
+            if backlog is not None:
+                backlogs[agent_pos] = backlog
+        counts = np.diff(storage.agent_ptr)
+        C = np.repeat([agent.C for agent in self.agents], counts)
+        # If there is no backlog entry, aspiration is set to expected value assuming only state is realized
+        aspiration = storage.dividend / C
+        is_backlog = np.zeros(self.num_securities, dtype=bool)
+        for agent_pos, backlog in backlogs.items():
+            start, end = storage.agent_ptr[agent_pos], storage.agent_ptr[agent_pos + 1]
+            aspiration[start:end] = backlog
+            is_backlog[start:end] = True
+        # If the agent knows a state is not realized, its aspiration will be 0
+        aspiration[storage.not_info] = 0
+        is_backlog &= ~storage.not_info
+        storage.aspiration[:] = aspiration
+        # Store initial aspirations levels in aspirations table of our database, with the same rows as initializeAspiration
+        agent_nums = np.repeat([agent.agent_num for agent in self.agents], counts)
+        self.db.insertMany("aspirations", [
+            [self.period_num, agent_num, state_num, c, a, 0, b]
+            for agent_num, state_num, c, a, b in zip(agent_nums.tolist(), storage.state_nums.tolist(), C.tolist(), aspiration.tolist(), is_backlog.astype(int).tolist())
+        ])
 
     # Called at the beginning of a period
     # Resets the cash balance of each agent to 0
     # Re-endow each agent with E of each security they have
     def resetSmallWorlds(self) -> None:
+        if self.storage is not None:
+            self.storage.balance[:] = 0
+            self.storage.amount += self.E
+            return
         for small_world in self.small_worlds.values():
             small_world.balanceReset()
             for state in small_world.states.values():
@@ -211,10 +475,14 @@ class LargeWorld:
     # Called at the end of a period to pay out all dividends as appropriate
     # Log how much of each security each agent has at the end of a period in security_balances table in database
     def realizePeriod(self) -> None:
+        if self.storage is not None:
+            self.realizeArrayPeriod()
+            return
         for small_world in self.small_worlds.values():
+            backlog = []
             for state_num, state in small_world.getStatesMap().items():
                 is_realized = 1 if state_num in self.R else 0
-                self.cur.execute("INSERT INTO security_balances VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.db.insert("security_balances",
                                 [
                                     self.period_num, 
                                     small_world.agent_num, 
@@ -231,67 +499,128 @@ class LargeWorld:
                 if is_realized:
                     small_world.balanceAdd(state.amount * state.dividend)
                     if self.use_backlog:
-                        state.updateAspirationBacklog(dividendFirstOrderAdaptive(state.aspiration, state.dividend, self.beta))
+                        backlog.append(dividendFirstOrderAdaptive(state.aspiration, state.dividend, self.beta))
                 # Security was not realized
                 elif self.use_backlog:
-                    state.updateAspirationBacklog(dividendFirstOrderAdaptive(state.aspiration, 0, self.beta))
+                    backlog.append(dividendFirstOrderAdaptive(state.aspiration, 0, self.beta))
                 state.amountReset()
+            if self.use_backlog:
+                small_world.updateAspirationBacklog(backlog)
 
-    # Picks a random security to submit a bid/ask for
-    # Used in market type 1
-    def pickRandomState(self):
-        # Either pick a random agent and then a random state
-        if self.pick_agent_first:
-            rand_agent = random.choice(self.getAgents())
-            return random.choice(list(rand_agent.getStateObjects()))
+    # Same as realizePeriod for securities in a SecurityStorage, with every security paid out at once
+    def realizeArrayPeriod(self) -> None:
+        # NumPy is only needed for array storage
+        import numpy as np
+        storage = self.storage
+        counts = np.diff(storage.agent_ptr)
+        is_realized = np.isin(storage.state_nums, list(self.R)).astype(np.int64)
+        amount, dividend = storage.amount, storage.dividend
+        agent_nums = np.repeat([agent.agent_num for agent in self.agents], counts)
+        self.db.insertMany("security_balances", [
+            [self.period_num, agent_num, state_num, a, d, v, r]
+            for agent_num, state_num, a, d, v, r in zip(
+                agent_nums.tolist(), storage.state_nums.tolist(), amount.tolist(), dividend.tolist(), (is_realized * amount * dividend).tolist(), is_realized.tolist()
+            )
+        ])
+        # Pay out the dividends of realized securities, adding them to each balance one security at a time like balanceAdd does
+        realized = is_realized.astype(bool)
+        np.add.at(storage.balance, np.repeat(np.arange(len(self.agents)), counts)[realized], (amount * dividend)[realized])
+        if self.use_backlog:
+            backlog = (self.beta * (dividend * is_realized) + (1 - self.beta) * storage.aspiration).tolist()
+            for agent_pos, small_world in enumerate(self.agents):
+                small_world.updateAspirationBacklog(backlog[storage.agent_ptr[agent_pos]:storage.agent_ptr[agent_pos + 1]])
+        amount[:] = 0
+
+    # Builds self.iteration, the function that conducts one iteration of this large world
+    # The market type, how securities are picked and the representativeness module never change during a simulation,
+    # so they are only looked at once here instead of in every iteration
+    def buildIterationPlan(self) -> None:
+        if self.market_type == 1:
+            self.iteration = self.buildMarketType1Iteration()
+        else:
+            self.iteration = self.marketType2Iteration
+
+    # Returns the function that conducts an iteration for a market of type 1
+    # Everything it needs is bound to local variables, and the groups of securities it picks from are built once
+    def buildMarketType1Iteration(self):
+        choice, uniform = random.choice, random.uniform
+        update_bidder, update_asker = self.market_table.updateBidder, self.market_table.updateAsker
+        # Either pick a random agent and then one of its states
         # Or a random state number and then a random agent's security of that same state number
+        if self.pick_agent_first:
+            groups = [list(agent.getStateObjects()) for agent in self.agents]
         else:
-            rand_state_num = random.choice(self.L)
-            return random.choice(self.market_table.getMarket(rand_state_num).getReserve())
+            groups = [self.market_table.getMarket(state_num).getReserve() for state_num in self.L]
+
+        def marketType1Iteration(iteration_num: int) -> None:
+            # rand_state is a security that we want to submit a bid/ask for for a certain agent
+            rand_state = choice(choice(groups))
+            # Randomly choose to either submit a bid or ask
+            # If a bid is chosen, then a bid is generated between 0 and the state's CAL for that security
+            if choice(ACTIONS) == "bid":
+                update_bidder(uniform(0, rand_state.aspiration), rand_state, iteration_num)
+            # Or an ask is generated between the agent's CAL and what they know to be the payoff that security
+            else:
+                update_asker(uniform(rand_state.aspiration, rand_state.dividend), rand_state, iteration_num)
+
+        if self.block_random:
+            # NumPy is only needed for block random streams
+            from iteration_stream import IterationStream, BLOCK_SIZE
+            self.stream = IterationStream(groups, random.getrandbits(64))
+            draw_block = self.stream.drawBlock
+            picks = bids = uniforms = ()
+
+            # Same iteration, with the security, the action and the price uniform drawn ahead of time in blocks
+            # The first iteration of every block draws the decisions of the whole block, and no block spans two periods
+            def marketType1Iteration(iteration_num: int) -> None:
+                nonlocal picks, bids, uniforms
+                pos = iteration_num % BLOCK_SIZE
+                if pos == 0:
+                    picks, bids, uniforms = draw_block(min(BLOCK_SIZE, self.num_iterations - iteration_num))
+                rand_state = picks[pos]
+                if bids[pos]:
+                    update_bidder(rand_state.aspiration * uniforms[pos], rand_state, iteration_num)
+                else:
+                    aspiration = rand_state.aspiration
+                    update_asker(aspiration + (rand_state.dividend - aspiration) * uniforms[pos], rand_state, iteration_num)
+
+        # If self.rep_threshold is not None, then trigger representativeness module 3 after rep_threshold iterations
+        if self.rep_threshold is None:
+            return marketType1Iteration
+        rep_threshold, rep_module = self.rep_threshold, self.repModule3
+
+        def marketType1IterationRep3(iteration_num: int) -> None:
+            marketType1Iteration(iteration_num)
+            if rep_threshold < iteration_num:
+                rep_module()
+        return marketType1IterationRep3
 
     def repModule3(self) -> None: 
+        # Make sure that there is a previous transaction to base judgement on
+        latest_price = self.market_table.getLatestPrice()
+        if latest_price == -1:
+            return
         # First randomly generate a probability threshold that applies to all agents
         p = random.uniform(0, REPRESENTATIVENESS_MAX_PROBABILITY)
-        # Generate a random number for each agent
-        # If their random number is below the probability threshold, enact rep module 3
+        # Each agent independently enacts rep module 3 with probability p
+        # Only the agents it applies to are drawn, so this costs one random number per affected agent instead of one per agent
         # For each agent that rep module 3 applies to, it searches among its securities
         # And identifies the one with the closest dividend to the latest transaction price in the market
         # And then, it sets the aspiration of that security to its personal dividend
         # And everything else to 0
-        for agent in self.getAgents():
-            # Make sure that there is a previous transaction to base judgement on
-            latest_price = self.market_table.getLatestPrice()
-            if random.uniform(0, 1) < p and latest_price != -1:
-                closest_dividend = agent.getClosestDividend(latest_price)
-                for state_num, dividend in agent.getUncertainStatesMap().items():
-                    # This implicitly assumes agents will not have the same dividend for different securities
-                    # ie. representativeness heuristic 3 only works with heterogenous dividend preferences across securities
-                    # Assumption is CAL is set to state dividend if a security has the closest dividend payoff to the latest transaction
-                    if dividend == closest_dividend:
-                        agent.getSecurity(state_num).updateAspiration(dividend)
-                        # if period_num < 3: print(f"Period num: {period_num}, iteration num: {iteration_num}, deduced for agent {agent.agent_num}, security {state_num} must be realized")
-                    # All other securities are presumed to be unrealized ie. CAL is 0
-                    else:
-                        agent.getSecurity(state_num).updateAspiration(0)
-
-    # Conducts an iteration for a market of type 1
-    def marketType1Iteration(self) -> None:
-        rand_state = self.pickRandomState()
-        # At this point, rand_state is a security that we want to submit a bid/ask for for a certain agent
-        # Randomly choose to either submit a bid or ask
-        rand_action = random.choice(["bid", "ask"])
-        # If a bid is chosen, then a bid is generated between 0 and the state's CAL for that security
-        if rand_action == "bid":
-            bid = random.uniform(0, rand_state.aspiration)
-            self.market_table.updateBidder(bid, rand_state, self.iteration_num)
-        # Or an ask is generated between the agent's CAL and what they know to be the payoff that security
-        else:
-            ask = random.uniform(rand_state.aspiration, rand_state.dividend)
-            self.market_table.updateAsker(ask, rand_state, self.iteration_num)
-
-        # If self.rep_threshold is not None, then trigger representativeness module 3
-        if self.rep_threshold is not None and self.rep_threshold < self.iteration_num:
-            self.repModule3()
+        for agent_pos in bernoulliSuccesses(len(self.agents), p):
+            agent = self.agents[agent_pos]
+            closest_dividend = agent.getClosestDividend(latest_price)
+            for state_num, dividend in agent.getUncertainStatesMap().items():
+                # This implicitly assumes agents will not have the same dividend for different securities
+                # ie. representativeness heuristic 3 only works with heterogenous dividend preferences across securities
+                # Assumption is CAL is set to state dividend if a security has the closest dividend payoff to the latest transaction
+                if dividend == closest_dividend:
+                    agent.getSecurity(state_num).updateAspiration(dividend)
+                    # if period_num < 3: print(f"Period num: {period_num}, iteration num: {iteration_num}, deduced for agent {agent.agent_num}, security {state_num} must be realized")
+                # All other securities are presumed to be unrealized ie. CAL is 0
+                else:
+                    agent.getSecurity(state_num).updateAspiration(0)
 
     # Implements the representativeness module used in Mike's implementation of Rational Expectations
     # First, to add a little bit of irrationality, 1 agent is randomly chosen to have the representativeness module apply to them
@@ -299,7 +628,10 @@ class LargeWorld:
     # That has not been ruled out yet and sets the aspiration for that to the dividend payout and the others to 0
     # This means that the market must keep track of the minimum price for a given period
     def repModuleMike(self):
-        random_agent = random.choice(self.getAgents())
+        # The worker processes of the parallel engine have to catch up before aspirations are read or changed
+        if self.parallel_workers:
+            self.market_table.sync()
+        random_agent = random.choice(self.agents)
         # We want to find the smallest minimum prices across all securities that are unknown
         minMinPrice = 1
         for state_num, state in random_agent.states.items():
@@ -317,25 +649,30 @@ class LargeWorld:
                 # print(f"Rep Module, iteration {iteration_num}, security {state_num} CAL set to {state.dividend}")
             else:
                 state.updateAspiration(state.dividend)
+        # The vectorized engine keeps its own copy of aspirations during a period
+        if self.vectorized:
+            self.market_table.pullAgent(random_agent)
 
     # Next, in each iteration, each agent generates a random price for each of its securities
     # Based on this price, the action is classified as a bid or ask in a fashion that may not be 50/50 as it is in market type 1
     # Only after this occures for each agent is a market clearing transaction conducted
     def genBidAsk(self):
-        for agent in self.getAgents():
-            for state in agent.getStatesMap().values():
-                random_price = random.uniform(0, 1)
-                # Ask
-                if random_price > state.getAspiration():
-                    self.market_table.updateAsker(random_price, state, self.iteration_num)
-                # Bid
-                else:
-                    self.market_table.updateBidder(random_price, state, self.iteration_num)
+        uniform, iteration_num = random.uniform, self.iteration_num
+        update_bidder, update_asker = self.market_table.updateBidder, self.market_table.updateAsker
+        for state in self.securities:
+            random_price = uniform(0, 1)
+            # Ask
+            if random_price > state.aspiration:
+                update_asker(random_price, state, iteration_num)
+            # Bid
+            else:
+                update_bidder(random_price, state, iteration_num)
 
     # Conducts an iteration for a market of type 2
     # In market type 2, the double auction is not quite continuous
     # Instead transactions are only conducted after each agent has had the chance to bid/ask on each of its securities
-    def marketType2Iteration(self) -> None:
+    def marketType2Iteration(self, iteration_num: int) -> None:
+        self.iteration_num = iteration_num
         rand_num = random.uniform(0, 1)
         rand_rho = random.uniform(0, 1) * self.rho
         # We only apply representativeness module if representativeness module 3 is indicated
@@ -346,7 +683,10 @@ class LargeWorld:
             and rand_num > rand_rho
         ):
             self.repModuleMike()
-        self.genBidAsk()
+        if self.vectorized:
+            self.market_table.genBidAsk(self.iteration_num)
+        else:
+            self.genBidAsk()
         self.market_table.tableMarketMake(self.iteration_num)
     
     # Runs one period of the simulation
@@ -356,25 +696,51 @@ class LargeWorld:
         # We make the model choice that states not in any small worlds may still be realized
         # Self.S contains simply a list of the number of states, which includes states that are possibly outside the scope of any agent
         # Initialize R by choosing r random states in the large world with equal probability to be realized 
-        self.R = random.sample(range(self.S), r)
+        perf = self.perf
+        if perf:
+            perf.start()
+            backlog_counts = self.backlogCounts()
+        self.R = set(random.sample(range(self.S), r))
         # Store information about which states are unrealized and realized in this period in database
-        dm.updateRealizationsTable(self.cur, self.period_num, self.S, self.R)
+        dm.updateRealizationsTable(self.db, self.period_num, self.S, self.R)
         # Reset the balance and endowment of each of our agents
         self.resetSmallWorlds()
+        if perf:
+            perf.lap("reset_small_worlds")
         # Give information to each of our agent
         self.giveMinimalIntelligence()
+        if self.vectorized:
+            self.market_table.loadPeriod()
+        else:
+            self.market_table.updateInformed()
+        if perf:
+            perf.lap("give_minimal_intelligence")
         # Conduct each market making iteration using a single processor 
+        # The iteration plan already conducts the appropriate iteration for the type of market
+        iteration = self.iteration
+        self.num_iterations = i
         for iteration_num in range(i):
-            self.iteration_num = iteration_num
-            # Conduct the appropriate iteration depending on what type of market it is
-            if self.market_type == 1:
-                self.marketType1Iteration()
-            elif self.market_type == 2:
-                self.marketType2Iteration()
+            iteration(iteration_num)
         # Finish the period
-        self.market_table.tableReset()
+        if self.vectorized:
+            self.market_table.storePeriod()
+        if perf:
+            perf.lap("iterations")
+            # Market type 1 submits one order per iteration, market type 2 one for every security in every iteration
+            perf.count("iterations", i)
+            perf.count("orders", i if self.market_type == 1 else i * self.num_securities)
+            perf.count("trades", self.market_table.getNumTransactions())
+        self.price_statistics = self.market_table.getPriceStatistics()
+        self.market_table.tableReset(self.R)
+        if perf:
+            perf.lap("table_reset")
         self.realizePeriod()
-        dm.updateAgentsTable(self.cur, self.period_num, self.small_worlds.values())
+        if perf:
+            perf.lap("realize_period")
+            # Small worlds count every search of their backlog, once per agent and period, and every info_key they evict
+            for name, total in self.backlogCounts().items():
+                perf.count(name, total - backlog_counts[name])
+        dm.updateAgentsTable(self.db, self.period_num, self.small_worlds.values())
 
     # Runs the simulation for the large world
     # Parameters
@@ -382,14 +748,131 @@ class LargeWorld:
     # i: int                number of market making iterations
     # r: int                number of states that will be realized, must be <= S
     def simulate(self, num_periods: int, i: int, r: int):
+        for _ in self.iterPeriods(num_periods, i, r):
+            pass
+
+    # Runs the simulation for the large world one period at a time, with the same parameters as simulate
+    # Yields the summary of each period once it is stored in the database, see periodSummary
+    # A caller can stop early by breaking out of the loop, in which case the database is closed after the last period it received
+    # With a stopping rule, no more periods are run once the prices have converged
+    def iterPeriods(self, num_periods: int, i: int, r: int):
+        self.stop_period = None
         # Run num_periods periods
-        for period_num in range(num_periods):
+        for period_num in range(self.start_period, num_periods):
             self.period_num = period_num
+            num_rows, num_flushes = sum(self.db.num_rows.values()), self.db.num_flushes
+            # Each period is written to the database in its own transaction
+            self.db.begin()
             self.period(i, r)
+            self.db.commit()
+            if self.perf:
+                # Rows still buffered at the end of the period are written when it is committed, the others were flushed during the period
+                self.perf.lap("db_writes")
+                self.perf.count("rows_written", sum(self.db.num_rows.values()) - num_rows)
+                self.perf.count("db_flushes", self.db.num_flushes - num_flushes)
+                self.db.begin()
+                self.perf.storePeriod(self.db, period_num)
+                self.db.commit()
+            converged = self.convergence is not None and self.convergence.update(self.price_statistics, self.R)
+            # Checkpoints are only written once the period is safely in the database
+            if self.checkpoint_interval and (period_num + 1) % self.checkpoint_interval == 0:
+                self.writeCheckpoint()
             print(f"Finished running period {period_num}")
-        # Save and close database connection
-        self.con.commit()
-        self.con.close()
+            try:
+                yield self.periodSummary()
+            except GeneratorExit:
+                self.finishSimulation()
+                raise
+            if converged:
+                self.stop_period = period_num
+                print(f"Prices converged after period {period_num}")
+                break
+        self.finishSimulation()
+
+    # Returns a summary of the period that just ended
+    # period_num: int                                   number of the period
+    # realized: List[int]                               states realized in the period
+    # prices: dict{int: tuple}                          mean, standard deviation and volume of the prices of each security in the period
+    # balances: dict{int: float}                        cash balance of each agent at the end of the period, including dividends
+    def periodSummary(self) -> dict:
+        return {
+            "period_num": self.period_num,
+            "realized": sorted(self.R),
+            "prices": self.price_statistics,
+            "balances": {agent_num: agent.balance for agent_num, agent in self.small_worlds.items()},
+        }
+
+    # Called once no more periods will be run
+    def finishSimulation(self) -> None:
+        if self.online_statistics:
+            self.db.begin()
+            dm.deleteUntradedPricesByPeriod(self.cur)
+        if self.convergence is not None:
+            self.db.begin()
+            dm.updateStoppingTable(self.db, self.cur, self.convergence, self.stop_period)
+        if self.perf:
+            print(self.perf.summary())
+        if self.parallel_workers:
+            self.market_table.close()
+        # Close database connection
+        self.db.close()
+
+    # Writes everything needed to continue the simulation after the current period to checkpoint_file
+    # Aspirations, not_info and the markets are all reset at the start of a period,
+    # so beyond the agents and their securities only the random states and the period number need to be kept
+    def writeCheckpoint(self) -> None:
+        checkpoint = {
+            "period_num": self.period_num,
+            "L": self.L,
+            "states_lists": {agent_num: agent.getStateNums() for agent_num, agent in self.small_worlds.items()},
+            "agents": [
+                (
+                    agent_num,
+                    agent.balance,
+                    [(state.amount, state.aspiration) for state in agent.states.values()],
+                    (agent.aspiration_backlog, agent.backlog_hits, agent.backlog_misses, agent.backlog_evictions)
+                )
+                for agent_num, agent in self.small_worlds.items()
+            ],
+            "random_state": random.getstate(),
+            "numpy_state": self.market_table.rng.bit_generator.state if self.vectorized else None,
+            "stream_state": self.stream.rng.bit_generator.state if self.block_random else None,
+            "db_rows": dict(self.db.num_rows),
+            "convergence_history": self.convergence.history if self.convergence is not None else None,
+        }
+        # Write to a temporary file first so that a crash while writing never leaves a broken checkpoint behind
+        with open(self.checkpoint_file + ".tmp", "wb") as f:
+            pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.checkpoint_file + ".tmp", self.checkpoint_file)
+
+    # Restores the agents, markets and random states stored in a checkpoint
+    def restoreCheckpoint(self, checkpoint: dict) -> None:
+        self.start_period = checkpoint["period_num"] + 1
+        for agent_num, balance, securities, backlog in checkpoint["agents"]:
+            agent = self.small_worlds[agent_num]
+            agent.balance = balance
+            for state, (amount, aspiration) in zip(agent.states.values(), securities):
+                state.amount = amount
+                state.aspiration = aspiration
+            agent.aspiration_backlog, agent.backlog_hits, agent.backlog_misses, agent.backlog_evictions = backlog
+        self.market_table.setPeriod(self.start_period)
+        random.setstate(checkpoint["random_state"])
+        if self.vectorized:
+            self.market_table.rng.bit_generator.state = checkpoint["numpy_state"]
+        if self.block_random:
+            self.stream.rng.bit_generator.state = checkpoint["stream_state"]
+        self.db.num_rows = checkpoint["db_rows"]
+        # Checkpoints written before a stopping rule was chosen have no history, in which case it starts over
+        if self.convergence is not None and checkpoint.get("convergence_history"):
+            self.convergence.history = checkpoint["convergence_history"][:]
+
+    # Returns the backlog counters of all small worlds added together
+    def backlogCounts(self) -> dict:
+        return {
+            "backlog_hits": sum(agent.backlog_hits for agent in self.agents),
+            "backlog_misses": sum(agent.backlog_misses for agent in self.agents),
+            "backlog_evictions": sum(agent.backlog_evictions for agent in self.agents),
+        }
 
     def getAgents(self) -> 'List[SmallWorld]':
         return list(self.small_worlds.values())
@@ -1,7 +1,10 @@
 from large_world import LargeWorld
 from simulation_statistics import runStatistics
 import time
+import random
 from parse_input import obtainParameters
+from replications import runReplications
+from sweep import runSweep
 
 DEFAULT_ALPHA = .05
 DEFAULT_BETA = .15
@@ -18,6 +21,9 @@ MARKET_TYPES = 2
 # It runs a round of the simulation
 def runInputFile(input_file):
     p = obtainParameters(input_file)
+    # A seed makes the run reproducible
+    if p.get("seed") is not None:
+        random.seed(p["seed"])
     start = time.time()
     # Initialize the large world
     L = LargeWorld(p)
@@ -31,6 +37,20 @@ def runInputFile(input_file):
     print(f"Successfully ran simulation! This simulation took {round(end - start, 1)} seconds to run. Results can be found in {db_name}")
     runStatistics(db_name)
 
+# Continues the simulation of an input file from the latest checkpoint written while running it
+# The results are identical to those of a simulation that was never interrupted
+def resumeInputFile(input_file):
+    p = obtainParameters(input_file)
+    checkpoint_file = p["file_name"] + ".ckpt"
+    start = time.time()
+    L = LargeWorld(p, checkpoint_file)
+    print(f"Resuming simulation from period {L.start_period}! This could take a few minutes...")
+    L.simulate(p["num_periods"], p["i"], p["r"])
+    end = time.time()
+    db_name = input_file[:-3] + ".db"
+    print(f"Successfully ran simulation! Resuming this simulation took {round(end - start, 1)} seconds to run. Results can be found in {db_name}")
+    runStatistics(db_name)
+
 # Creates an input file based on what the user enters and runs a round of the simulation with it
 # If at any point, an invalid parameter is entered, a Value Exception is raised
 # Descriptions of each parameter is embedded within the input it prompts the user for
@@ -86,6 +106,28 @@ def handleInput():
         backlog_flag = input("Do you want to use a backlog when giving agents intelligence? (Yes/No) ")
     p["use_backlog"] = (backlog_flag == "yes")
 
+    p["vectorized"] = False
+    if p["market_type"] == 2:
+        vectorized_flag = ""
+        while vectorized_flag not in ["yes", "no"]:
+            vectorized_flag = input("Do you want to run market type 2 on the vectorized NumPy engine? (Yes/No) ").strip().lower()
+        p["vectorized"] = (vectorized_flag == "yes")
+
+    p["block_random"] = False
+    if p["market_type"] == 1:
+        block_flag = ""
+        while block_flag not in ["yes", "no"]:
+            block_flag = input("Do you want to draw the random decisions of market type 1 in blocks with NumPy? (Yes/No) ").strip().lower()
+        p["block_random"] = (block_flag == "yes")
+
+    # Only the vectorized engine can run without an object per security
+    p["array_storage"] = False
+    if p["vectorized"]:
+        storage_flag = ""
+        while storage_flag not in ["yes", "no"]:
+            storage_flag = input("Do you want to keep securities in NumPy arrays instead of one object each to save memory on large runs? (Yes/No) ").strip().lower()
+        p["array_storage"] = (storage_flag == "yes")
+
     p["rep_flag"] = ""
     while p["rep_flag"] not in ["1", "2", "3"]:
         p["rep_flag"] = input("Do you want to use representativeness module '1', '2', or '3'? ")
@@ -197,6 +239,9 @@ def menu():
     print("-" * 75)
     print("'input': input p and run a round of the simulation")
     print("'run': run an already existing input file")
+    print("'resume': continue running an input file from its latest checkpoint")
+    print("'replicate': run independent replications of an already existing input file in parallel")
+    print("'sweep': run every job of a sweep file that has not finished yet")
     print("'q' to quit")
     i = input("Enter your choice here: ").strip().lower()
     if i == "q":
@@ -209,6 +254,23 @@ def menu():
         runInputFile(input_file)
         # except:
         #     print("That's an invalid input file, try again")
+    elif i == "resume":
+        input_file = input("Enter input file name: ")
+        resumeInputFile(input_file)
+    elif i == "replicate":
+        input_file = input("Enter input file name: ")
+        num_replications, num_workers = -1, -1
+        while num_replications <= 0:
+            try: num_replications = int(input("Number of replications: "))
+            except: pass
+        while num_workers <= 0:
+            try: num_workers = int(input("Number of worker processes: "))
+            except: pass
+        seed = input("Seed, or leave blank to use the seed in the input file: ").strip()
+        runReplications(input_file, num_replications, num_workers, int(seed) if seed else None)
+    elif i == "sweep":
+        sweep_file = input("Enter sweep file name: ")
+        runSweep(sweep_file)
     else:
         print("That's not a valid option, try again")
     menu()
@@ -1,4 +1,5 @@
 import agent_intelligence as ai
+from math import sqrt
 
 class Market:
     # Attributes:
@@ -13,8 +14,11 @@ class Market:
     # Mechanism-specific
     # by_midpoint: bool             whether or not transaction prices should be the midpoint of the bid-ask spread, if False we use the price of the earlier order
     # reserve: List[State]          all State objects of the small  worlds that are participating in this market
-    # cur: Cursor                   Cursor object to execute database commands
+    # informed: List[State]         State objects in reserve whose small world is uncertain about this state in the current period
+    # db: DatabaseWriter            buffered writer used to store transactions in database
     # num_transactions: int         number of transactions have been conducted in this market in this period
+    # price_mean: float             running mean of the transaction prices in this market in this period
+    # price_m2: float               running sum of squared differences from price_mean, used for Welford's algorithm
     # period_num: int               current period
     # alpha: float                  alpha for post-transaction first order adaptive process
     # phi: int                      phi for representativeness module
@@ -23,11 +27,17 @@ class Market:
     # price_history: List[float]    list of transaction prices for this market in a period
     # price_pattern: List[int]      stores a list of 1 for increasing price, -1 for decreasing price, and 0 for same
 
+    # Markets store their attributes in slots, which makes attribute access in the auction faster
+    __slots__ = ("bid", "bidder", "bidder_time", "ask", "asker", "asker_time",
+                 "by_midpoint", "reserve", "informed", "db", "num_transactions", "price_mean", "price_m2",
+                 "period_num", "alpha", "phi", "epsilon", "rep_flag", "price_history", "price_pattern")
+
     # A Market object is created which represents the market for a particular security
-    def __init__(self, by_midpoint: bool, cur, alpha: float, phi: int, epsilon: float, rep_flag: int):
-        self.cur = cur
+    def __init__(self, by_midpoint: bool, db, alpha: float, phi: int, epsilon: float, rep_flag: int):
+        self.db = db
         self.by_midpoint, self.alpha, self.phi, self.epsilon, self.rep_flag = by_midpoint, alpha, phi, epsilon, rep_flag
         self.reserve = []
+        self.informed = []
 
         # Initialize period as -1 becuase it will be incremented to 0 once period reset function is called
         self.period_num = -1
@@ -51,13 +61,33 @@ class Market:
     def periodReset(self) -> None:
         self.marketReset(-1)
         self.num_transactions = 0
+        self.price_mean = 0
+        self.price_m2 = 0
         self.period_num += 1
         self.price_history = []
         self.price_pattern = []
 
+    # Updates the running price statistics with a new transaction price using Welford's algorithm
+    # Called after num_transactions has been incremented
+    def updatePriceStatistics(self, price: float) -> None:
+        delta = price - self.price_mean
+        self.price_mean += delta / self.num_transactions
+        self.price_m2 += delta * (price - self.price_mean)
+
+    # Returns the mean, standard deviation and volume of the transaction prices in this period
+    # The standard deviation is 0 if there are not at least 2 transactions
+    def getPriceStatistics(self) -> tuple:
+        st_dev = sqrt(self.price_m2 / (self.num_transactions - 1)) if self.num_transactions > 1 else 0
+        return self.price_mean, st_dev, self.num_transactions
+
     def reserveAdd(self, state) -> None:
         self.reserve.append(state)
 
+    # Rebuild the participants that learn from transactions in this market
+    # Called at the start of a period once every agent has been given its information
+    def updateInformed(self) -> None:
+        self.informed = [state for state in self.reserve if state.state_num not in state.parent_world.not_info]
+
     # Only update bidder if new bidder is higher or there is no current bidder
     # Returns transaction price if market clearing transaction was conducted, -1 otherwise
     def updateBidder(self, new_bid: float, new_bidder, time: int) -> bool:
@@ -104,7 +134,7 @@ class Market:
         buyer_id = self.bidder.parent_world.agent_num
         seller_id = self.asker.parent_world.agent_num
         action = 1 if self.bidder_time > self.asker_time else 0
-        self.cur.execute("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+        self.db.insert("transactions",
                         [self.period_num, time, state_num, self.num_transactions, buyer_id, seller_id, 
                         transaction_price, action, self.bid, self.bidder.aspiration, self.ask, self.asker.aspiration, self.bid - self.ask]
                         )
@@ -112,6 +142,7 @@ class Market:
         # Reset the market and adjust the aspiration of our agents who are aware of this state
         # Test to see if there is a string of increases or decreases that would trigger the representativeness module
         self.num_transactions += 1
+        self.updatePriceStatistics(transaction_price)
         if self.price_history:
             if self.price_history[-1] < transaction_price:
                 self.price_pattern.append(1)
@@ -123,16 +154,21 @@ class Market:
         pattern = ai.detectPattern(self.phi, self.price_pattern)
 
         # Apply necessary changes to all participants in this market for this security
-        for state in self.reserve:
-            if state_num not in state.parent_world.not_info:
-                # Enact
-                state.updateAspiration(ai.priceFirstOrderAdaptive(state.aspiration, transaction_price, self.alpha))
-                # 2 choices of the representativeness module
-                if self.rep_flag == 1:
-                    state.updateAspiration(ai.representativenessAdjustment1(state, self.epsilon, pattern))
-                elif self.rep_flag == 2:
-                    state.updateAspiration(ai.representativenessAdjustment2(state, self.epsilon, pattern))
+        # Enact
+        ai.priceFirstOrderAdaptiveAll(self.informed, transaction_price, self.alpha)
+        # 2 choices of the representativeness module
+        # Participants only differ in the states of their other securities, so the adjustments can follow the batched update
+        # Neither adjustment changes an aspiration unless a pattern is detected
+        if self.rep_flag == 1 and pattern is not None:
+            for state in self.informed:
+                state.updateAspiration(ai.representativenessAdjustment1(state, self.epsilon, pattern))
+        elif self.rep_flag == 2 and pattern == "decreasing":
+            for state in self.informed:
+                state.updateAspiration(ai.representativenessAdjustment2(state, self.epsilon, pattern))
     
         # Reset the market after a successful transaction
         self.marketReset(time)
-        return transaction_price
\ No newline at end of file
+        return transaction_price
+
+    def getReserve(self) -> 'List[State]':
+        return self.reserve
\ No newline at end of file
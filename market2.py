@@ -1,4 +1,5 @@
 import agent_intelligence as ai
+from math import sqrt
 
 class Market2:
     # Attributes:
@@ -13,20 +14,29 @@ class Market2:
     # Mechanism-specific
     # by_midpoint: bool             whether or not transaction prices should be the midpoint of the bid-ask spread, if False we use the price of the earlier order
     # reserve: List[State]          all State objects of the small  worlds that are participating in this market
-    # cur: Cursor                   Cursor object to execute database commands
+    # informed: List[State]         State objects in reserve whose small world is uncertain about this state in the current period
+    # db: DatabaseWriter            buffered writer used to store transactions in database
     # num_transactions: int         number of transactions have been conducted in this market in this period
+    # price_mean: float             running mean of the transaction prices in this market in this period
+    # price_m2: float               running sum of squared differences from price_mean, used for Welford's algorithm
     # period_num: int               current period
     # alpha: float                  alpha for post-transaction first order adaptive process
     # min_price: int                the minimum price of a transaction for this market in a period
 
+    # Markets store their attributes in slots, which makes attribute access in the auction faster
+    __slots__ = ("bid", "bidder", "bidder_time", "ask", "asker", "asker_time",
+                 "by_midpoint", "reserve", "informed", "db", "num_transactions", "price_mean", "price_m2",
+                 "period_num", "alpha", "min_price")
+
     # A Market object is created which represents the market for a particular security
-    def __init__(self, by_midpoint: bool, cur, alpha: float):
-        self.cur = cur
+    def __init__(self, by_midpoint: bool, db, alpha: float):
+        self.db = db
         self.by_midpoint = by_midpoint
         self.alpha = alpha
 
         # Initialize period as -1 becuase it will be incremented to 0 once period reset function is called
         self.reserve = []
+        self.informed = []
         self.period_num = -1
         self.periodReset()
 
@@ -48,25 +58,51 @@ class Market2:
     def periodReset(self) -> None:
         self.marketReset(-1)
         self.num_transactions = 0
+        self.price_mean = 0
+        self.price_m2 = 0
         self.period_num += 1
         self.min_price = 1
 
+    # Updates the running price statistics with a new transaction price using Welford's algorithm
+    # Called after num_transactions has been incremented
+    def updatePriceStatistics(self, price: float) -> None:
+        delta = price - self.price_mean
+        self.price_mean += delta / self.num_transactions
+        self.price_m2 += delta * (price - self.price_mean)
+
+    # Returns the mean, standard deviation and volume of the transaction prices in this period
+    # The standard deviation is 0 if there are not at least 2 transactions
+    def getPriceStatistics(self) -> tuple:
+        st_dev = sqrt(self.price_m2 / (self.num_transactions - 1)) if self.num_transactions > 1 else 0
+        return self.price_mean, st_dev, self.num_transactions
+
     def reserveAdd(self, state) -> None:
         self.reserve.append(state)
 
+    # Rebuild the participants that learn from transactions in this market
+    # Called at the start of a period once every agent has been given its information
+    def updateInformed(self) -> None:
+        self.informed = [state for state in self.reserve if state.state_num not in state.parent_world.not_info]
+
     # Only update bidder if new bidder is higher or there is no current bidder
-    def updateBidder(self, new_bid: float, new_bidder, time: int) -> None:
+    # Returns True if the bid was updated and now meets the ask, so the market may be able to clear
+    def updateBidder(self, new_bid: float, new_bidder, time: int) -> bool:
         if not self.bidder or new_bid > self.bid:
             self.bid = new_bid
             self.bidder = new_bidder
             self.bidder_time = time
+            return self.asker is not None and self.bid >= self.ask
+        return False
     
     # Only update asker if they have more than 1 in their security balance and there is no current asker or their ask is lower
-    def updateAsker(self, new_ask: float, new_asker, time: int) -> None:
+    # Returns True if the ask was updated and now meets the bid, so the market may be able to clear
+    def updateAsker(self, new_ask: float, new_asker, time: int) -> bool:
         if new_asker.amount > 0 and (not self.asker or new_ask < self.ask):
             self.ask = new_ask
             self.asker = new_asker
             self.asker_time = time
+            return self.bidder is not None and self.bid >= self.ask
+        return False
 
     # Checks to see if there is a market clearing transaction and if there is, it conducts the trade
     # Returns either the price of the transaction or -1 to signify no transaction was conducted
@@ -101,7 +137,7 @@ class Market2:
         buyer_id = self.bidder.parent_world.agent_num
         seller_id = self.asker.parent_world.agent_num
         action = 1 if self.bidder_time > self.asker_time else 0
-        self.cur.execute("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+        self.db.insert("transactions",
                         [
                             self.period_num, 
                             time, 
@@ -119,10 +155,9 @@ class Market2:
                         ]
         )
         self.num_transactions += 1
+        self.updatePriceStatistics(transaction_price)
         # Apply the first order adapative process to all participants that have this security in their small world
-        for state in self.reserve:
-            if state_num not in state.parent_world.not_info:
-                state.updateAspiration(ai.priceFirstOrderAdaptive(state.aspiration, transaction_price, self.alpha))
+        ai.priceFirstOrderAdaptiveAll(self.informed, transaction_price, self.alpha)
 
         # Reset the market after a successful transaction
         self.marketReset(time)
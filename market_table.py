@@ -4,20 +4,24 @@ class MarketTable:
     # Attributes:
     # table: dict{state_num: Market}    the market for each state number
     # latest_price: float               price of latest transaction conducted in this period
+    # db: DatabaseWriter                buffered writer used to store the statistics of each period
+    # online_statistics: bool           if True, the price statistics of each market are stored in prices_by_period at the end of each period
 
     # Parameters all taken from large world
+    # reserves links each state number with the securities of that state, grouped by state number in the order of agents
     # Create MarketTable object
     # MarketTable is a map that links a security number with its Market object
-    def __init__(self, L, small_worlds: dict, by_midpoint: bool, cur, alpha: float, phi: int, epsilon: float, rep_flag: int):
+    def __init__(self, L, reserves: dict, by_midpoint: bool, db, alpha: float, phi: int, epsilon: float, rep_flag: int, online_statistics: bool = False):
+        self.db = db
+        self.online_statistics = online_statistics
         self.table = dict()
         # Create a market for each security in large world
         for state_num in L:
-            self.table[state_num] = Market(by_midpoint, cur, alpha, phi, epsilon, rep_flag)
-        for small_world in small_worlds.values():
-            # Add all securities to the reserve bank of its respective market
-            # This esentially is a storage of all participants in that market
-            for state_num, state in small_world.states.items():
-                self.table[state_num].reserveAdd(state)
+            self.table[state_num] = Market(by_midpoint, db, alpha, phi, epsilon, rep_flag)
+        # reserves holds the securities of every agent in each market, which become the reserve bank of that market
+        # This esentially is a storage of all participants in that market
+        for state_num, reserve in reserves.items():
+            self.table[state_num].reserve = reserve
         self.latest_price = -1
     
     def __str__(self) -> str:
@@ -27,8 +31,24 @@ class MarketTable:
             ans += f"{state_num}: {str(self.table[state_num])}\n"
         return ans
 
+    # Called at the start of a period once every agent has been given its information
+    def updateInformed(self) -> None:
+        for market in self.table.values():
+            market.updateInformed()
+
+    # Sets the period every market is in, used when resuming from a checkpoint
+    def setPeriod(self, period_num: int) -> None:
+        for market in self.table.values():
+            market.period_num = period_num
+
     # Called at the end of a period to reset all the markets
-    def tableReset(self) -> None:
+    # R is the set of states realized in the period that is ending
+    def tableReset(self, R = ()) -> None:
+        if self.online_statistics:
+            self.db.insertMany("prices_by_period", [
+                [state_num, self.table[state_num].period_num, mean, st_dev, volume, 1 if state_num in R else 0]
+                for state_num, (mean, st_dev, volume) in self.getPriceStatistics().items()
+            ])
         for market in self.table.values():
             market.periodReset()
         self.latest_price = -1
@@ -50,6 +70,14 @@ class MarketTable:
     def getLatestPrice(self) -> float:
         return self.latest_price
 
+    # Returns a dictionary linking the state number of each market with the mean, standard deviation and volume of its prices in this period
+    def getPriceStatistics(self) -> dict:
+        return {state_num: market.getPriceStatistics() for state_num, market in self.table.items()}
+
+    # Returns the number of transactions conducted in all markets in this period
+    def getNumTransactions(self) -> int:
+        return sum(market.num_transactions for market in self.table.values())
+
     # Get market corresponding to the one trading security state_num
     def getMarket(self, state_num) -> Market:
         return self.table[state_num]
\ No newline at end of file
@@ -3,20 +3,27 @@ from market2 import Market2
 class MarketTable2:
     # Attributes:
     # table: dict{state_num: Market}    the market for each state number
+    # db: DatabaseWriter                buffered writer used to store the statistics of each period
+    # online_statistics: bool           if True, the price statistics of each market are stored in prices_by_period at the end of each period
+    # crossable: set{int}               state numbers of the markets whose bid met their ask when it was last updated in this iteration
+    #                                   only these markets can possibly clear at the end of the iteration
 
     # Parameters all taken from large world
+    # reserves links each state number with the securities of that state, grouped by state number in the order of agents
     # Create MarketTable object
     # MarketTable is a map that links a security number with its Market object
-    def __init__(self, L, small_worlds: dict, by_midpoint: bool, cur, alpha: float):
+    def __init__(self, L, reserves: dict, by_midpoint: bool, db, alpha: float, online_statistics: bool = False):
+        self.db = db
+        self.online_statistics = online_statistics
         self.table = {}
+        self.crossable = set()
         # Create a market for each security in large world
         for state_num in L:
-            self.table[state_num] = Market2(by_midpoint, cur, alpha)
-        for small_world in small_worlds.values():
-            # Add all securities to the reserve bank of its respective market
-            # This esentially is a storage of all participants in that market
-            for state_num, state in small_world.states.items():
-                self.table[state_num].reserveAdd(state)
+            self.table[state_num] = Market2(by_midpoint, db, alpha)
+        # reserves holds the securities of every agent in each market, which become the reserve bank of that market
+        # This esentially is a storage of all participants in that market
+        for state_num, reserve in reserves.items():
+            self.table[state_num].reserve = reserve
         self.latest_price = -1
     
     def __str__(self) -> str:
@@ -26,29 +33,61 @@ class MarketTable2:
             ans += f"{state_num}: {str(self.table[state_num])}\n"
         return ans
 
+    # Called at the start of a period once every agent has been given its information
+    def updateInformed(self) -> None:
+        for market in self.table.values():
+            market.updateInformed()
+
+    # Sets the period every market is in, used when resuming from a checkpoint
+    def setPeriod(self, period_num: int) -> None:
+        for market in self.table.values():
+            market.period_num = period_num
+
     # Called at the end of a period to reset all the markets
-    def tableReset(self) -> None:
+    # R is the set of states realized in the period that is ending
+    def tableReset(self, R = ()) -> None:
+        if self.online_statistics:
+            self.db.insertMany("prices_by_period", [
+                [state_num, self.table[state_num].period_num, mean, st_dev, volume, 1 if state_num in R else 0]
+                for state_num, (mean, st_dev, volume) in self.getPriceStatistics().items()
+            ])
         for market in self.table.values():
             market.periodReset()
+        self.crossable.clear()
         self.latest_price = -1
     
     # When a bid/ask is randomly generated, it gets passed along to the correct security market
-    def updateBidder(self, new_bid: float, new_bidder, time: int):
-        price = self.table[new_bidder.state_num].updateBidder(new_bid, new_bidder, time)
+    # Markets whose bid meets their ask after the update are remembered so they are cleared at the end of the iteration
+    def updateBidder(self, new_bid: float, new_bidder, time: int) -> None:
+        if self.table[new_bidder.state_num].updateBidder(new_bid, new_bidder, time):
+            self.crossable.add(new_bidder.state_num)
 
-    def updateAsker(self, new_ask: float, new_asker, time: int):
-        price = self.table[new_asker.state_num].updateAsker(new_ask, new_asker, time)
+    def updateAsker(self, new_ask: float, new_asker, time: int) -> None:
+        if self.table[new_asker.state_num].updateAsker(new_ask, new_asker, time):
+            self.crossable.add(new_asker.state_num)
     
-    # Attempts to create a market clearing transaction for each of the markets in the table
+    # Attempts to create a market clearing transaction for each of the markets whose bid met their ask in this iteration
     # Called at the end of an iteration
+    # Every other market either has not changed since it last failed to clear or can not clear, so it is skipped
+    # Markets are still cleared in the order of the table, which is in increasing state number, so the balances of agents add up the same way
     def tableMarketMake(self, iteration_num: int) -> None:
-        for market in self.table.values():
-            market.marketMake(iteration_num)
+        table = self.table
+        for state_num in sorted(self.crossable):
+            table[state_num].marketMake(iteration_num)
+        self.crossable.clear()
 
     # Returns the minimum price for the market of state_num
     def getMarketMinPrice(self, state_num: int) -> float:
         return self.table[state_num].getMinPrice()
 
+    # Returns a dictionary linking the state number of each market with the mean, standard deviation and volume of its prices in this period
+    def getPriceStatistics(self) -> dict:
+        return {state_num: market.getPriceStatistics() for state_num, market in self.table.items()}
+
+    # Returns the number of transactions conducted in all markets in this period
+    def getNumTransactions(self) -> int:
+        return sum(market.num_transactions for market in self.table.values())
+
     # Get market corresponding to the one trading security state_num
     def getMarket(self, state_num) -> Market2:
         return self.table[state_num]
\ No newline at end of file
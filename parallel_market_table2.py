@@ -0,0 +1,282 @@
+import multiprocessing
+from collections import deque
+import numpy as np
+from vector_market_table2 import VectorMarketTable2
+
+# Most iterations the workers may run ahead of the trades that have been combined
+# Bounds the number of unread trades waiting in the pipes, so workers never block on a full pipe for long
+PIPELINE_DEPTH = 8
+
+# Constants of the SplitMix64 generator
+SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+SPLITMIX_MUL1 = np.uint64(0xBF58476D1CE4E5B9)
+SPLITMIX_MUL2 = np.uint64(0x94D049BB133111EB)
+
+# Returns the SplitMix64 hash of every element of x, an array of unsigned 64 bit integers
+def splitmix64(x: 'ndarray') -> 'ndarray':
+    x = x + SPLITMIX_GAMMA
+    x = (x ^ (x >> np.uint64(30))) * SPLITMIX_MUL1
+    x = (x ^ (x >> np.uint64(27))) * SPLITMIX_MUL2
+    return x ^ (x >> np.uint64(31))
+
+# Returns a uniform random number in [0, 1) for each of the securities in positions, for iteration time of the period with period_seed
+# Every security has its own counter based stream, so the numbers a market draws do not depend on which worker process draws them
+def counterUniforms(period_seed: int, time: int, positions: 'ndarray') -> 'ndarray':
+    key = splitmix64(np.array([period_seed ^ time], dtype=np.uint64))
+    return (splitmix64(key + positions.astype(np.uint64) * SPLITMIX_GAMMA) >> np.uint64(11)) * 2.0 ** -53
+
+class MarketShard:
+    # Attributes:
+    # markets: ndarray[int]                 position in the large world of each market of this shard
+    # positions: ndarray[int]               position in storage of each security traded in this shard, in increasing order
+    # market_of: ndarray[int]               position in markets of the market each security of this shard trades in
+    # by_midpoint: bool                     whether or not transaction prices should be the midpoint of the bid-ask spread
+    # alpha: float                          alpha for post-transaction first order adaptive process
+    # amount, aspiration, not_info          views of the shared storage arrays, holding every security of the large world
+    # informed: ndarray[bool]               whether or not the owner of each security of this shard is uncertain about its state
+    # period_seed: int                      seed of the random streams of the current period
+    # bid, bidder, bidder_time, ask, asker, asker_time
+    #                                       standing orders of each market of this shard, as in VectorMarketTable2
+    #                                       bidder and asker are positions in positions
+
+    # The markets one worker process runs for a ParallelMarketTable2
+    # Only ever changes the amounts and aspirations of its own securities, so shards never write to the same part of storage
+    def __init__(self, markets, positions, market_of, by_midpoint: bool, alpha: float, amount, aspiration, not_info):
+        self.markets, self.positions, self.market_of = markets, positions, market_of
+        self.by_midpoint, self.alpha = by_midpoint, alpha
+        self.amount, self.aspiration, self.not_info = amount, aspiration, not_info
+        self.period_seed = 0
+        num_markets = len(markets)
+        self.bid = np.zeros(num_markets)
+        self.ask = np.ones(num_markets)
+        self.bidder = np.full(num_markets, -1, dtype=np.int64)
+        self.asker = np.full(num_markets, -1, dtype=np.int64)
+        self.bidder_time = np.full(num_markets, -1, dtype=np.int64)
+        self.asker_time = np.full(num_markets, -1, dtype=np.int64)
+        self.loadPeriod(0)
+
+    # Best orders are found exactly like in VectorMarketTable2, with positions and markets local to the shard
+    bestOrders = VectorMarketTable2.bestOrders
+
+    def loadPeriod(self, period_seed: int) -> None:
+        self.period_seed = period_seed
+        self.informed = ~self.not_info[self.positions]
+
+    def periodReset(self) -> None:
+        self.bid[:] = 0
+        self.ask[:] = 1
+        self.bidder[:] = -1
+        self.asker[:] = -1
+        self.bidder_time[:] = -1
+        self.asker_time[:] = -1
+
+    # Runs iteration time on every market of this shard: draws the orders of its securities, then clears every market whose bid meets its ask
+    # Returns the trades as a tuple of arrays, one entry per trade in the order of markets:
+    # markets, bidders, askers, prices, bids, asks, bidder times, asker times, bidder aspirations and asker aspirations
+    # Markets are positions in the large world and bidders and askers are positions in storage
+    # Returns None if no market traded, which keeps most messages back to the main process tiny
+    def iterate(self, time: int) -> tuple:
+        positions = self.positions
+        prices = counterUniforms(self.period_seed, time, positions)
+        aspiration = self.aspiration[positions]
+        is_ask = prices > aspiration
+
+        bids = np.flatnonzero(~is_ask)
+        markets, bidders, bid_prices = self.bestOrders(bids, prices[bids], True)
+        replace = (self.bidder[markets] == -1) | (bid_prices > self.bid[markets])
+        markets = markets[replace]
+        self.bid[markets] = bid_prices[replace]
+        self.bidder[markets] = bidders[replace]
+        self.bidder_time[markets] = time
+
+        # Only securities with a positive balance are able to ask
+        asks = np.flatnonzero(is_ask & (self.amount[positions] > 0))
+        markets, askers, ask_prices = self.bestOrders(asks, prices[asks], False)
+        replace = (self.asker[markets] == -1) | (ask_prices < self.ask[markets])
+        markets = markets[replace]
+        self.ask[markets] = ask_prices[replace]
+        self.asker[markets] = askers[replace]
+        self.asker_time[markets] = time
+
+        markets = np.flatnonzero(
+            (self.bidder != -1)
+            & (self.asker != -1)
+            & (self.bidder != self.asker)
+            & (self.bid >= self.ask)
+        )
+        if not markets.size:
+            return None
+        bid, ask = self.bid[markets], self.ask[markets]
+        bidder, asker = positions[self.bidder[markets]], positions[self.asker[markets]]
+        bidder_time, asker_time = self.bidder_time[markets], self.asker_time[markets]
+        if self.by_midpoint:
+            trade_prices = (bid + ask) / 2
+        else:
+            trade_prices = np.where(bidder_time < asker_time, bid, ask)
+        # Aspirations are reported as they were when the trade was made, before anyone learns from it
+        trades = (self.markets[markets], bidder, asker, trade_prices, bid, ask, bidder_time, asker_time, self.aspiration[bidder], self.aspiration[asker])
+
+        self.amount[asker] -= 1
+        self.amount[bidder] += 1
+        # Apply the first order adaptive process to all participants that have a traded security in their small world
+        traded_price = np.full(len(self.markets), np.nan)
+        traded_price[markets] = trade_prices
+        security_price = traded_price[self.market_of]
+        adapt = self.informed & ~np.isnan(security_price)
+        self.aspiration[positions[adapt]] = self.alpha * security_price[adapt] + (1 - self.alpha) * aspiration[adapt]
+
+        # Reset the markets after a successful transaction
+        self.bid[markets] = 0
+        self.ask[markets] = 1
+        self.bidder[markets] = -1
+        self.asker[markets] = -1
+        self.bidder_time[markets] = time
+        self.asker_time[markets] = time
+        return trades
+
+# Entry point of a worker process of a ParallelMarketTable2
+# Builds the shard on top of the shared storage arrays and then runs the commands it receives over conn until it is told to stop
+def runShard(conn, shard_args: tuple, shared: dict) -> None:
+    markets, positions, market_of, by_midpoint, alpha, num_securities = shard_args
+    shard = MarketShard(
+        markets, positions, market_of, by_midpoint, alpha,
+        np.frombuffer(shared["amount"], dtype=np.int64, count=num_securities),
+        np.frombuffer(shared["aspiration"], dtype=np.float64, count=num_securities),
+        np.frombuffer(shared["not_info"], dtype=np.bool_, count=num_securities),
+    )
+    while True:
+        command, arg = conn.recv()
+        if command == "iterate":
+            conn.send(shard.iterate(arg))
+        elif command == "load":
+            shard.loadPeriod(arg)
+        elif command == "reset":
+            shard.periodReset()
+        else:
+            break
+    conn.close()
+
+class ParallelMarketTable2(VectorMarketTable2):
+    # Attributes:
+    # Everything of VectorMarketTable2, except that its bid, ask, bidder, asker, bidder_time and asker_time are not used
+    # the shards own the standing orders instead
+    # num_workers: int                      number of worker processes
+    # processes: List[Process]              worker process of each shard, each running one contiguous range of markets
+    # connections: List[Connection]         pipe to each worker process
+    # period_seed: int                      seed of the random streams of the current period, drawn from rng
+    # agent_nums: ndarray[int]              agent number of each agent, in the order of agents
+    # pending: deque[int]                   iterations the workers were told to run whose trades have not been combined yet, oldest first
+
+    # Runs market type 2 with its markets split across num_workers worker processes
+    # Amounts, aspirations and information live in the shared memory of storage, which must have been created with a multiprocessing context
+    # Each worker draws the orders of its markets and clears them, then sends back its trades
+    # Balances, transactions and price statistics are combined here in the order of the markets once every worker is done with an iteration
+    # Iterations are pipelined: workers run up to PIPELINE_DEPTH iterations ahead, until sync waits for them to catch up
+    # sync must be called before anything reads or changes the amounts, aspirations or balances in the middle of a period
+    # Every security draws its prices from its own stream, so a simulation gives the same results with any number of workers
+    def __init__(self, L, small_worlds: dict, by_midpoint: bool, db, alpha: float, storage, online_statistics: bool = False, num_workers: int = 1):
+        self.connections = []
+        self.pending = deque()
+        VectorMarketTable2.__init__(self, L, small_worlds, by_midpoint, db, alpha, storage, online_statistics)
+        self.num_workers = num_workers
+        self.agent_nums = np.array([agent.agent_num for agent in self.agents], dtype=np.int64)
+
+        # Split the markets into contiguous ranges that each hold about the same number of securities
+        counts = np.bincount(self.market_of, minlength=len(self.markets))
+        bounds = np.searchsorted(np.cumsum(counts), np.arange(1, num_workers) * self.num_securities / num_workers, side="right")
+        bounds = [0, *sorted(set(bounds.tolist())), len(self.markets)]
+
+        context = multiprocessing.get_context("spawn")
+        self.processes = []
+        for start, end in zip(bounds, bounds[1:]):
+            if start == end:
+                continue
+            positions = np.flatnonzero((self.market_of >= start) & (self.market_of < end))
+            shard_args = (np.arange(start, end), positions, self.market_of[positions] - start, by_midpoint, alpha, self.num_securities)
+            parent_conn, child_conn = context.Pipe()
+            # Daemon processes do not outlive a simulation that crashes
+            process = context.Process(target=runShard, args=(child_conn, shard_args, storage.shared), daemon=True)
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.connections.append(parent_conn)
+
+    # Also draws the seed of the random streams of the period and hands it to the workers
+    def loadPeriod(self) -> None:
+        VectorMarketTable2.loadPeriod(self)
+        self.period_seed = int(self.rng.integers(2 ** 63))
+        for conn in self.connections:
+            conn.send(("load", self.period_seed))
+
+    def tableReset(self, R = ()) -> None:
+        VectorMarketTable2.tableReset(self, R)
+        for conn in self.connections:
+            conn.send(("reset", None))
+
+    # Starts the iteration on every worker, which draw and clear their markets in parallel
+    def genBidAsk(self, time: int) -> None:
+        for conn in self.connections:
+            conn.send(("iterate", time))
+        self.pending.append(time)
+
+    # The trades of the iteration are combined once the workers are PIPELINE_DEPTH iterations ahead or at the next sync
+    def tableMarketMake(self, time: int) -> None:
+        while len(self.pending) > PIPELINE_DEPTH:
+            self.combineTrades()
+
+    # Waits for the workers to finish every iteration they were told to run and combines their trades
+    def sync(self) -> None:
+        while self.pending:
+            self.combineTrades()
+
+    # Arrays and balances are only complete once the workers have caught up
+    def storePeriod(self) -> None:
+        self.sync()
+        VectorMarketTable2.storePeriod(self)
+
+    # Waits for every worker to finish the oldest pending iteration and combines its trades
+    # Workers hold contiguous ranges of markets in order, so their trades are combined in the order of the markets
+    def combineTrades(self) -> None:
+        time = self.pending.popleft()
+        results = [trades for trades in (conn.recv() for conn in self.connections) if trades is not None]
+        if not results:
+            return
+        markets, bidder, asker, prices, bid, ask, bidder_time, asker_time, bidder_aspiration, asker_aspiration = (np.concatenate(arrays) for arrays in zip(*results))
+        self.min_price[markets] = np.minimum(self.min_price[markets], prices)
+
+        # Balances are updated seller then buyer, market by market, in the same order as Market2
+        buyers, sellers = self.owner[bidder], self.owner[asker]
+        np.add.at(self.balance, np.column_stack((sellers, buyers)).ravel(), np.column_stack((prices, -1 * prices)).ravel())
+
+        # Store transaction data in database
+        self.db.insertMany("transactions", [
+            [self.period_num, time, state_num, transaction_num, buyer, seller, price, 1 if action else 0, b, b_aspiration, a, a_aspiration, spread]
+            for state_num, transaction_num, buyer, seller, price, action, b, b_aspiration, a, a_aspiration, spread in zip(
+                self.state_nums[bidder].tolist(),
+                self.num_transactions[markets].tolist(),
+                self.agent_nums[buyers].tolist(),
+                self.agent_nums[sellers].tolist(),
+                prices.tolist(),
+                (bidder_time > asker_time).tolist(),
+                bid.tolist(),
+                bidder_aspiration.tolist(),
+                ask.tolist(),
+                asker_aspiration.tolist(),
+                (bid - ask).tolist(),
+            )
+        ])
+        self.num_transactions[markets] += 1
+        # Update the running price statistics using Welford's algorithm
+        delta = prices - self.price_mean[markets]
+        self.price_mean[markets] += delta / self.num_transactions[markets]
+        self.price_m2[markets] += delta * (prices - self.price_mean[markets])
+
+    # Stops the worker processes, called once the simulation is over
+    def close(self) -> None:
+        self.sync()
+        for conn in self.connections:
+            conn.send(("stop", None))
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.connections, self.processes = [], []
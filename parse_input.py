@@ -1,8 +1,8 @@
 # If more inputs are added, they need to be added and categorized as such here
-INT_INPUTS = ["N", "S", "E", "market_type", "K", "phi", "num_periods", "i", "r", "num_trader_types", "rep_flag", "rep_threshold"]
-FLOAT_INPUTS = ["alpha", "beta", "epsilon", "rho"]
-BOOL_INPUTS = ["fix_num_states", "by_midpoint", "pick_agent_first", "is_custom", "use_backlog"]
-STR_INPUTS = ["file_name"]
+INT_INPUTS = ["N", "S", "E", "market_type", "K", "phi", "num_periods", "i", "r", "num_trader_types", "rep_flag", "rep_threshold", "seed", "checkpoint_interval", "stop_window", "backlog_capacity", "parallel_workers"]
+FLOAT_INPUTS = ["alpha", "beta", "epsilon", "rho", "stop_tolerance"]
+BOOL_INPUTS = ["fix_num_states", "by_midpoint", "pick_agent_first", "is_custom", "use_backlog", "vectorized", "array_storage", "online_statistics", "columnar_results", "block_random", "record_perf", "bulk_setup"]
+STR_INPUTS = ["file_name", "stop_rule"]
 
 # Reads in an input file of extension .in
 # Returns dictionary of parameters
@@ -20,20 +20,33 @@ def obtainParameters(input_file: str) -> dict:
     # Use copy of dict to prevent mutating it while iterating through it
     # Converts each parameter to the correct data type
     for var_name, var in dict(p).items():
-        if var_name in INT_INPUTS:
-            p[var_name] = int(var)
-        elif var_name in FLOAT_INPUTS:
-            p[var_name] = float(var)
-        elif var_name in BOOL_INPUTS:
-            p[var_name] = (var == "True")
-        elif var_name in STR_INPUTS:
-            continue
-        # Input is a list
-        else:
-            p[var_name] = list(map(float, var.split(",")))
-            # Convert the key of dividend payoffs for a security numbers to integers
+        p[var_name] = convertParameter(var_name, var)
+        # Convert the key of dividend payoffs for a security numbers to integers
+        if isinstance(p[var_name], list):
             try:
                 p[int(var_name)] = p[var_name]
                 del p[var_name]
             except: pass
     return p
+
+# Converts the string value of a parameter to the correct data type
+def convertParameter(var_name: str, var: str):
+    if var_name in INT_INPUTS:
+        return int(var)
+    elif var_name in FLOAT_INPUTS:
+        return float(var)
+    elif var_name in BOOL_INPUTS:
+        return (var == "True")
+    elif var_name in STR_INPUTS:
+        return var
+    # Input is a list
+    return list(map(float, var.split(",")))
+
+
+# Writes a dictionary of parameters to an input file of extension .in that obtainParameters can read back in
+def writeParameters(p: dict, input_file: str) -> None:
+    with open(input_file, "w") as f:
+        for var_name, var in p.items():
+            if isinstance(var, list):
+                var = ",".join(map(str, var))
+            f.write(f"{var_name}:{var}\n")
@@ -0,0 +1,75 @@
+import time
+
+class PerfRecorder:
+    # Attributes:
+    # seconds: dict{str: float}         seconds spent in each phase of the current period
+    # counts: dict{str: int}            counters of the current period
+    # total_seconds: dict{str: float}   seconds spent in each phase across all periods recorded so far
+    # total_counts: dict{str: int}      counters across all periods recorded so far
+    # mark: float                       time at which the phase currently being timed started
+    # writer: DatabaseWriter            writer whose time spent writing rows is counted as db_writes, None if there is none
+    # write_mark: float                 write_seconds of writer when the phase currently being timed started
+
+    # Records the time a simulation spends in each phase of a period and counts what happened in it
+    # Each period is stored in the perf table of the database and the totals are summarized at the end of a simulation
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.total_seconds = {}
+        self.total_counts = {}
+        self.writer = None
+        self.write_mark = 0
+        self.mark = time.perf_counter()
+
+    # Counts the time writer spends writing rows as db_writes instead of the phase it happened in
+    def watch(self, writer) -> None:
+        self.writer = writer
+        self.write_mark = writer.write_seconds
+
+    # Starts timing the first phase of a period
+    def start(self) -> None:
+        self.mark = time.perf_counter()
+        if self.writer is not None:
+            self.write_mark = self.writer.write_seconds
+
+    # Ends the phase currently being timed and starts timing the next one
+    # Rows the writer flushed during the phase, whether early or at a commit, are timed as db_writes
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        written = 0
+        if self.writer is not None:
+            written = self.writer.write_seconds - self.write_mark
+            self.write_mark = self.writer.write_seconds
+            self.addTime("db_writes", written)
+        self.addTime(phase, now - self.mark - written)
+        self.mark = now
+
+    def addTime(self, phase: str, seconds: float) -> None:
+        self.seconds[phase] = self.seconds.get(phase, 0) + seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    # Stores the phases and counters of a period in the perf table and adds them to the totals
+    def storePeriod(self, db, period_num: int) -> None:
+        db.insertMany("perf", [[period_num, "seconds", phase, seconds] for phase, seconds in self.seconds.items()])
+        db.insertMany("perf", [[period_num, "count", name, amount] for name, amount in self.counts.items()])
+        for phase, seconds in self.seconds.items():
+            self.total_seconds[phase] = self.total_seconds.get(phase, 0) + seconds
+        for name, amount in self.counts.items():
+            self.total_counts[name] = self.total_counts.get(name, 0) + amount
+        self.seconds, self.counts = {}, {}
+
+    # Returns a summary of the time spent in each phase and of the counters across all recorded periods
+    def summary(self) -> str:
+        total = sum(self.total_seconds.values())
+        ans = "Time spent in each phase:\n"
+        for phase, seconds in sorted(self.total_seconds.items(), key=lambda item: -item[1]):
+            share = 100 * seconds / total if total else 0
+            ans += f"\t{phase}: {round(seconds, 3)} seconds ({round(share, 1)}%)\n"
+        ans += "Counters:\n"
+        iteration_seconds = self.total_seconds.get("iterations")
+        for name, amount in self.total_counts.items():
+            rate = f" ({round(amount / iteration_seconds)} per second of iterations)" if iteration_seconds and name in ["iterations", "orders", "trades"] else ""
+            ans += f"\t{name}: {amount}{rate}\n"
+        return ans
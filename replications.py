@@ -0,0 +1,105 @@
+import random
+import sqlite3
+import statistics as stat
+import time
+from math import sqrt
+from multiprocessing import Pool
+import database_manager as dm
+from large_world import LargeWorld
+from parse_input import obtainParameters, writeParameters
+from simulation_statistics import runStatistics, obtainReader, obtainRealizations
+
+# Confidence level of the intervals reported across replications
+CONFIDENCE_LEVEL = .95
+
+# Runs a simulation with parameters p, seeded with p["seed"], and computes its summary statistics
+# The parameters are written to an input file next to the database so that runStatistics can find them
+# Returns the name of the database
+def runParameters(p: dict) -> str:
+    writeParameters(p, p["file_name"] + ".in")
+    random.seed(p["seed"])
+    L = LargeWorld(p)
+    L.simulate(p["num_periods"], p["i"], p["r"])
+    db_name = p["file_name"] + ".db"
+    runStatistics(db_name)
+    return db_name
+
+# Runs one replication of an input file with its own seed and its own database
+# Returns the replication number, its seed and the name of its database
+def runReplication(args: tuple) -> tuple:
+    input_file, replication_num, seed = args
+    p = obtainParameters(input_file)
+    p["file_name"] = f"{p['file_name']}_rep{replication_num}"
+    p["seed"] = seed
+    return replication_num, seed, runParameters(p)
+
+# Returns the mean of data together with the lower and upper bound of its confidence interval
+# Uses the normal approximation, which is accurate for the tens to hundreds of replications we run
+def confidenceInterval(data: 'List[float]') -> tuple:
+    mean = stat.mean(data)
+    if len(data) < 2:
+        return mean, mean, mean
+    half_width = stat.NormalDist().inv_cdf((1 + CONFIDENCE_LEVEL) / 2) * stat.stdev(data) / sqrt(len(data))
+    return mean, mean - half_width, mean + half_width
+
+# Combines the prices_by_period tables of all replications into the replication_summary table
+# Mean prices and standard deviations only average replications in which the security traded in that period
+# Volumes average every replication that ran the period, counting a replication that left the security out of prices_by_period as 0
+def summarizeReplications(cur, db_names: 'List[str]') -> None:
+    start = time.time()
+    dm.createReplicationSummaryTable(cur)
+    # Rows of prices_by_period and realized states of each replication
+    replications = []
+    for db_name in db_names:
+        con = sqlite3.connect(db_name)
+        prices = {(state_num, period_num): (mean, st_dev, volume, realized) for state_num, period_num, mean, st_dev, volume, realized in con.execute("SELECT * FROM prices_by_period")}
+        realizations = obtainRealizations(con.cursor(), obtainReader(db_name, obtainParameters(db_name[:-3] + ".in")))
+        replications.append((prices, realizations))
+        con.close()
+    # Securities that never traded in a replication are left out of its prices_by_period
+    # They are counted as a period without transactions in every replication that ran the period
+    # by_period[(state_num, period_num)] holds a (mean, st_dev, volume, realized) row for each replication that ran the period
+    by_period = {}
+    keys = set().union(*(prices for prices, _ in replications))
+    for prices, realizations in replications:
+        for key in keys:
+            if key in prices:
+                by_period.setdefault(key, []).append(prices[key])
+            elif key in realizations:
+                by_period.setdefault(key, []).append((0, 0, 0, realizations[key]))
+
+    rows = []
+    for (state_num, period_num), data in sorted(by_period.items()):
+        traded = [row for row in data if row[2] > 0]
+        mean, mean_ci_low, mean_ci_high = confidenceInterval([row[0] for row in traded]) if traded else (None, None, None)
+        st_dev = stat.mean([row[1] for row in traded]) if traded else None
+        volume, volume_ci_low, volume_ci_high = confidenceInterval([row[2] for row in data])
+        realized = stat.mean([row[3] for row in data])
+        rows.append([state_num, period_num, len(data), mean, mean_ci_low, mean_ci_high, st_dev, volume, volume_ci_low, volume_ci_high, realized])
+    cur.executemany("INSERT INTO replication_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    end = time.time()
+    print(f"Sucessfully added replication summary statistics to database. This operation took {round(end-start, 1)} seconds to complete")
+
+# Runs num_replications independent replications of an input file on a pool of num_workers processes
+# The seed of each replication is drawn from seed, or from the seed in the input file if none is given
+# Replications are stored in <file_name>_rep<n>.db and the combined summary in <file_name>_replications.db
+def runReplications(input_file: str, num_replications: int, num_workers: int, seed: int = None) -> str:
+    p = obtainParameters(input_file)
+    seed_generator = random.Random(seed if seed is not None else p.get("seed"))
+    seeds = [seed_generator.getrandbits(32) for _ in range(num_replications)]
+    start = time.time()
+    with Pool(num_workers) as pool:
+        results = sorted(pool.imap_unordered(runReplication, [(input_file, n, seeds[n]) for n in range(num_replications)]))
+    end = time.time()
+    print(f"Successfully ran {num_replications} replications. This took {round(end - start, 1)} seconds to run")
+
+    summary_db = p["file_name"] + "_replications.db"
+    con = sqlite3.connect(summary_db)
+    cur = con.cursor()
+    dm.createReplicationsTable(cur)
+    cur.executemany("INSERT INTO replications VALUES (?, ?, ?)", results)
+    summarizeReplications(cur, [db_name for _, _, db_name in results])
+    con.commit()
+    con.close()
+    print(f"Results of each replication can be found in {p['file_name']}_rep<n>.db and their summary in {summary_db}")
+    return summary_db
@@ -0,0 +1,153 @@
+import numpy as np
+from itertools import chain
+from small_world import BaseSmallWorld
+from state import BaseState
+
+class SecurityStorage:
+    # Attributes:
+    # agent_ptr: ndarray[int]       securities of the agent in position a are stored in positions agent_ptr[a] to agent_ptr[a + 1]
+    # state_nums: ndarray[int]      state number of each security
+    # amount: ndarray[int]          amount of each security
+    # aspiration: ndarray[float]    aspiration of each security
+    # dividend: ndarray[float]      dividend payoff of each security
+    # not_info: ndarray[bool]       whether or not the owner of each security knows its state is not realized
+    # balance: ndarray[float]       cash balance of each agent
+    # shared: dict{str: RawArray}   shared memory behind the amount, aspiration and not_info arrays, empty unless a context was given
+
+    # Struct-of-arrays storage for every agent and security in a large world
+    # Securities are laid out agent by agent in CSR fashion, so agents may own different numbers of securities
+    # states_lists holds the state numbers of each agent, in the order the agents are stored
+    # If context is a multiprocessing context, the arrays that worker processes read and write are allocated in shared memory
+    def __init__(self, states_lists: 'List[List[int]]', E: int, context = None):
+        lengths = [len(states_list) for states_list in states_lists]
+        self.agent_ptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.agent_ptr[1:])
+        num_securities = int(self.agent_ptr[-1])
+        self.state_nums = np.fromiter(chain.from_iterable(states_lists), dtype=np.int64, count=num_securities)
+        self.shared = {}
+        self.amount = self.sharedArray(context, "amount", num_securities, np.int64, E)
+        self.aspiration = self.sharedArray(context, "aspiration", num_securities, np.float64, 0)
+        self.dividend = np.zeros(num_securities)
+        self.not_info = self.sharedArray(context, "not_info", num_securities, np.bool_, False)
+        self.balance = np.zeros(len(lengths))
+
+    # Returns an array of size elements filled with fill
+    # With a multiprocessing context, the array is a view of a RawArray stored in shared under name
+    def sharedArray(self, context, name: str, size: int, dtype, fill) -> 'ndarray':
+        if context is None:
+            return np.full(size, fill, dtype=dtype)
+        self.shared[name] = context.RawArray("b", max(size, 1) * np.dtype(dtype).itemsize)
+        array = np.frombuffer(self.shared[name], dtype=dtype, count=size)
+        array[:] = fill
+        return array
+
+    # Whether every agent owns the same number of securities, as they do when the number of states in each small world is fixed
+    def isDense(self) -> bool:
+        return len(set(np.diff(self.agent_ptr).tolist())) <= 1
+
+    # Returns an agent by security view of one of the security arrays
+    # Only possible when every agent owns the same number of securities
+    def asMatrix(self, array: 'ndarray') -> 'ndarray':
+        if not self.isDense():
+            raise ValueError("Agents own different numbers of securities, so securities can not be viewed as a matrix")
+        return array.reshape(len(self.balance), -1)
+
+class ArraySmallWorld(BaseSmallWorld):
+    # Attributes:
+    # Everything of BaseSmallWorld
+    # storage: SecurityStorage      arrays that hold the balance of this small world and the values of its securities
+    # agent_pos: int                position of this small world in storage
+
+    __slots__ = ("storage", "agent_pos")
+
+    # A small world whose balance and securities live in a SecurityStorage
+    # No object is kept for its securities, states builds ArrayState views of them whenever it is asked for
+    # The NumPy engines work on the positions of securities in storage instead, so they never need the views
+    def __init__(self, agent_num: int, states_list, E: int, storage: SecurityStorage, agent_pos: int, backlog_capacity: int = None):
+        self.storage = storage
+        self.agent_pos = agent_pos
+        # The storage already holds the states_list and the endowment of every security
+        BaseSmallWorld.__init__(self, agent_num, len(states_list), backlog_capacity=backlog_capacity)
+
+    # Positions in storage of the first and one past the last security of this small world
+    def bounds(self) -> tuple:
+        return self.storage.agent_ptr.item(self.agent_pos), self.storage.agent_ptr.item(self.agent_pos + 1)
+
+    @property
+    def balance(self) -> float:
+        return self.storage.balance.item(self.agent_pos)
+
+    @balance.setter
+    def balance(self, balance: float) -> None:
+        self.storage.balance[self.agent_pos] = balance
+
+    # Dictionary of states in this small world with key state number and value a new ArrayState view
+    @property
+    def states(self) -> dict:
+        start, end = self.bounds()
+        return {state_num: ArrayState(self, state_num, index) for index, state_num in enumerate(self.storage.state_nums[start:end].tolist(), start)}
+
+    def getStateNums(self) -> 'List[int]':
+        start, end = self.bounds()
+        return self.storage.state_nums[start:end].tolist()
+
+    def getSecurity(self, security_num) -> 'ArrayState':
+        start, end = self.bounds()
+        return ArrayState(self, security_num, start + self.storage.state_nums[start:end].tolist().index(security_num))
+
+    # Same as SmallWorld.giveNotInfo, reading the dividends straight from storage and marking not_info there as well
+    def giveNotInfo(self, not_info) -> None:
+        self.not_info = frozenset(not_info)
+        self.C = self.num_states - len(self.not_info)
+        self.uncertain = {}
+        self.info_key = 0
+        start, end = self.bounds()
+        flags = []
+        for bit, (state_num, dividend) in enumerate(zip(self.storage.state_nums[start:end].tolist(), self.storage.dividend[start:end].tolist())):
+            is_not_info = state_num in self.not_info
+            flags.append(is_not_info)
+            if is_not_info:
+                self.info_key |= 1 << bit
+            else:
+                self.uncertain[state_num] = dividend
+        self.uncertain_dividends = sorted(self.uncertain.values())
+        self.storage.not_info[start:end] = flags
+
+class ArrayState(BaseState):
+    # Attributes:
+    # state_num: int                the number of the state in large world
+    # parent_world: ArraySmallWorld small world that contains this security, whose storage holds its amount, aspiration and dividend
+    # index: int                    position of this security in storage
+
+    __slots__ = ("state_num", "parent_world", "index")
+
+    # A short lived view of a security whose amount, aspiration and dividend live in a SecurityStorage
+    # Behaves exactly like State to the rest of the simulation
+    def __init__(self, parent_world: ArraySmallWorld, state_num: int, index: int):
+        self.state_num = state_num
+        self.parent_world = parent_world
+        self.index = index
+
+    @property
+    def amount(self) -> int:
+        return self.parent_world.storage.amount.item(self.index)
+
+    @amount.setter
+    def amount(self, amount: int) -> None:
+        self.parent_world.storage.amount[self.index] = amount
+
+    @property
+    def aspiration(self) -> float:
+        return self.parent_world.storage.aspiration.item(self.index)
+
+    @aspiration.setter
+    def aspiration(self, aspiration: float) -> None:
+        self.parent_world.storage.aspiration[self.index] = aspiration
+
+    @property
+    def dividend(self) -> float:
+        return self.parent_world.storage.dividend.item(self.index)
+
+    @dividend.setter
+    def dividend(self, dividend: float) -> None:
+        self.parent_world.storage.dividend[self.index] = dividend
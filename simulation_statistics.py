@@ -2,91 +2,122 @@ import sqlite3
 import statistics as stat
 import database_manager as dm
 import time
+from itertools import groupby
 from parse_input import obtainParameters
 
+# Streams every transaction price in a single pass over the transactions table, ordered by state_num and group_column
+# Yields the state number, the value of group_column and the list of prices for each group
+# Groups without any transactions are never yielded
+def groupedPrices(cur, group_column: str):
+    cur.execute(f"SELECT state_num, {group_column}, price FROM transactions ORDER BY state_num, {group_column}")
+    for (state_num, group), rows in groupby(cur, key=lambda r: (r[0], r[1])):
+        yield state_num, group, [r[2] for r in rows]
+
+# Same as groupedPrices, but reads the transactions stored as columns by a ColumnarWriter
+# Only the state_num, group_column and price columns are ever read
+def groupedColumnarPrices(reader, group_column: str):
+    import numpy as np
+    state_nums, groups, prices = reader.readColumns("transactions", ["state_num", group_column, "price"])
+    if not len(prices):
+        return
+    order = np.lexsort((groups, state_nums))
+    state_nums, groups, prices = state_nums[order], groups[order], prices[order]
+    # Positions where a new (state_num, group) pair starts
+    starts = np.flatnonzero((state_nums[1:] != state_nums[:-1]) | (groups[1:] != groups[:-1])) + 1
+    for start, end in zip([0, *starts.tolist()], [*starts.tolist(), len(prices)]):
+        yield int(state_nums[start]), int(groups[start]), prices[start:end].tolist()
+
+# Returns the mean, standard deviation and volume of a list of prices
+# We log the mean as 0 if there are no transactions
+# We log the standard deviation as 0 if there are not at least 2 data points
+def summarizePrices(prices) -> tuple:
+    mean = stat.mean(prices) if prices else 0
+    sd = stat.stdev(prices) if len(prices) > 1 else 0
+    return mean, sd, len(prices)
+
+# Returns a dictionary linking each (state_num, period_num) pair of a simulation with whether that state was realized in that period
+# If reader is given, realizations are read from its columns instead of the database
+def obtainRealizations(cur, reader = None) -> dict:
+    if reader is None:
+        cur.execute("SELECT state_num, period_num, realized FROM realizations")
+        return {(state_num, period_num): r for state_num, period_num, r in cur.fetchall()}
+    columns = reader.readColumns("realizations", ["state_num", "period_num", "realized"])
+    return {(state_num, period_num): r for state_num, period_num, r in zip(*(column.tolist() for column in columns))}
+
 # Calculate mean, standard deviation, volume, and whether realized or not for securities across different periods
 # Store data in prices_by_period table in database
-def pricePathByPeriod(cur, p: dict) -> None:
+# If reader is given, transactions and realizations are read from its columns instead of the database
+def pricePathByPeriod(cur, p: dict, reader = None) -> None:
     start = time.time()
-    S = p["S"]
     dm.createPricesByPeriodTable(cur)
-    num_periods = p["num_periods"]
-    for state_num in range(S):
-        price_data = []
-        x = range(num_periods)
-        for period_num in x:
-            cur.execute("SELECT price FROM transactions WHERE state_num=? AND period_num=?", (state_num, period_num))
-            rows = cur.fetchall()
-            # No transactions during this period
-            if not rows:
-                price_data.append([])
-                continue
-            period_prices = list(map(lambda r: r[0], rows))
-            price_data.append(period_prices)
-
-        # Account for possibility that no agents have this security in their small world
-        if not list(filter(lambda x: x, price_data)):
-            continue
+    realized = obtainRealizations(cur, reader)
+    grouped = groupedPrices(cur, "period_num") if reader is None else groupedColumnarPrices(reader, "period_num")
+    # A simulation with a stopping rule may have run fewer than num_periods periods
+    num_periods = max((period_num for _, period_num in realized), default=-1) + 1
 
-        # We log the mean as 0 if there are no transactions
-        means = list(map(lambda z: stat.mean(z) if z else 0, price_data))
-        # We log the standard deviation as 1 if there are not at least 2 data points
-        sds = list(map(lambda z: stat.stdev(z) if len(z) > 1 else 0, price_data))
-        volumes = list(map(len, price_data))
-        cur.execute("SELECT realized FROM realizations WHERE state_num=?", (state_num,))
-        # We make the assumption that the realized data is insered chronologically by period
-        realized = list(map(lambda r: r[0], cur.fetchall()))
+    # price_stats[state_num][period_num] holds the summary statistics of that security in that period
+    price_stats = {}
+    for state_num, period_num, prices in grouped:
+        price_stats.setdefault(state_num, {})[period_num] = summarizePrices(prices)
 
-        # Update our database
-        for i in range(num_periods):
-            cur.execute("INSERT INTO prices_by_period VALUES (?, ?, ?, ?, ?, ?)", 
-                        [state_num, i, means[i], sds[i], volumes[i], realized[i]])
+    # Securities that no agents have in their small world never show up in price_stats and are ignored
+    rows = []
+    for state_num in sorted(price_stats):
+        for period_num in range(num_periods):
+            mean, sd, volume = price_stats[state_num].get(period_num, (0, 0, 0))
+            rows.append([state_num, period_num, mean, sd, volume, realized[(state_num, period_num)]])
+    cur.executemany("INSERT INTO prices_by_period VALUES (?, ?, ?, ?, ?, ?)", rows)
     end = time.time()
     print(f"Sucessfully added price path by period statistics to database. This operation took {round(end-start, 1)} seconds to complete")
 
 # Calculates mean, standard deviation, and volume for a security across different transaction numbers across all periods
 # Stores data in prices_by_transaction table in database
-def pricePathByTransaction(cur, p: dict) -> None:
+# If reader is given, transactions are read from its columns instead of the database
+def pricePathByTransaction(cur, p: dict, reader = None) -> None:
     start = time.time()
-    # If we want to have all securities display up to the highest transaction, we just set max_transactions to the most number of transactions they have in a period
-    S = p["S"]
     dm.createPricesByTransactionTable(cur)
-    for state_num in range(S):
-        cur.execute("SELECT MAX(transaction_num) FROM transactions WHERE state_num=?", (state_num,))
-        max_transactions = cur.fetchone()[0]
-        # Account for possibility that no agents have this security in their small world
-        # We choose to ignore such states
-        if not max_transactions:
-            continue
+    grouped = groupedPrices(cur, "transaction_num") if reader is None else groupedColumnarPrices(reader, "transaction_num")
 
-        # Create a list with all the transactions that occur 
-        price_data = []
-        x = range(max_transactions)
-        for t in x:
-            cur.execute("SELECT price FROM transactions WHERE state_num=? AND transaction_num=?", (state_num, t))
-            t_prices = list(map(lambda r: r[0], cur.fetchall()))
-            price_data.append(t_prices)
+    # price_stats[state_num][transaction_num] holds the summary statistics of that transaction number across all periods
+    price_stats = {}
+    for state_num, transaction_num, prices in grouped:
+        price_stats.setdefault(state_num, {})[transaction_num] = summarizePrices(prices)
 
-        # We log the mean as 0 if there are no transactions
-        means = list(map(lambda z: stat.mean(z) if z else 0, price_data))
-        # We log the standard deviation as 1 if there are not at least 2 data points
-        sds = list(map(lambda z: stat.stdev(z) if len(z) > 1 else 0, price_data))
-        volumes = list(map(len, price_data))
-        # Update db
-        for t in x:
-            cur.execute("INSERT INTO prices_by_transaction VALUES (?, ?, ?, ?, ?)",
-                        [state_num, t, means[t], sds[t], volumes[t]])
+    rows = []
+    for state_num in sorted(price_stats):
+        # If we want to have all securities display up to the highest transaction, we just set max_transactions to the most number of transactions they have in a period
+        max_transactions = max(price_stats[state_num])
+        if not max_transactions:
+            continue
+        for t in range(max_transactions):
+            mean, sd, volume = price_stats[state_num].get(t, (0, 0, 0))
+            rows.append([state_num, t, mean, sd, volume])
+    cur.executemany("INSERT INTO prices_by_transaction VALUES (?, ?, ?, ?, ?)", rows)
     end = time.time()
     print(f"Sucessfully added price path by transaction statistics to database. This operation took {round(end-start, 1)} seconds to complete")
 
+# Returns a reader of the columns of a simulation that stored its largest tables as columns, None otherwise
+def obtainReader(db: str, p: dict):
+    if not p.get("columnar_results"):
+        return None
+    # NumPy is only needed for columnar results
+    from columnar_storage import ColumnarReader
+    return ColumnarReader(db[:-3] + ".columns")
+
 def runStatistics(db: str):
     con = sqlite3.connect(db)
     cur = con.cursor()
     p = obtainParameters(db[:-3] + ".in")
 
+    reader = obtainReader(db, p)
+    if reader is None:
+        dm.createTransactionsIndexes(cur)
+
     # Create summary statistics in our database
-    pricePathByPeriod(cur, p)
-    pricePathByTransaction(cur, p)
+    # Markets already stored prices_by_period while the simulation ran
+    if not p.get("online_statistics"):
+        pricePathByPeriod(cur, p, reader)
+    pricePathByTransaction(cur, p, reader)
 
     con.commit()
-    con.close()
\ No newline at end of file
+    con.close()
@@ -1,29 +1,45 @@
+from array import array
+from bisect import bisect_left
 from state import State
 
-class SmallWorld:
+class BaseSmallWorld:
     # Attributes:
     # agent_num: int                    the number of this small world in large world
     # num_states: int                   number of states in this small world
-    # balance: float                    cash balance
-    # not_info: List[int]               list of the state numbers the agent knows are not realized
-    # states: dict{state_num: State}    dictionary of states in this small world with key state number and value State object
+    # not_info: frozenset[int]          set of the state numbers the agent knows are not realized
+    # info_key: int                     bitmask of which of this small world's states are in not_info, in the order of states
+    #                                   identifies the information the agent received independently of the order it was given in
     # C: int                            number of states for whom the outcome is uncertain
     # uncertain: dict{state_num: int}   keys are state numbers that are not in not_info or we are clued in about through representativeness adjustment
     #                                   values are their respective dividend payoffs
+    # uncertain_dividends: List[float]  sorted dividend payoffs of the states in uncertain, used to look up the closest dividend with a binary search
+    # aspiration_backlog: dict{int: array[float]}
+    #                                   links an info_key with the dividend first order adaptive aspiration of each state, in the order of states
+    #                                   None until the first aspirations are backlogged, so simulations without a backlog do not hold N empty dicts
+    #                                   ordered from least to most recently used
+    # backlog_capacity: int             most info_keys kept in the backlog, None for no limit
+    # backlog_hits: int                 number of backlog lookups that found the aspirations of the current info_key
+    # backlog_misses: int               number of backlog lookups that did not
+    # backlog_evictions: int            number of info_keys removed from the backlog to stay within backlog_capacity
 
-    # Intialize a small world with its agent_number (number of the small world in a large world),
-    # a list of states that will be endowed with E each, as well as a cash balanace which is 0 by default
-    def __init__(self, agent_num: int, states_list, E: int, balance = 0):
+    # Everything a small world knows and does apart from holding its balance and securities, which SmallWorld keeps as attributes
+    # and ArraySmallWorld keeps in a SecurityStorage, so neither carries slots the other needs
+    # Subclasses provide balance and states
+    __slots__ = ("agent_num", "num_states", "not_info", "info_key", "C", "uncertain", "uncertain_dividends",
+                 "aspiration_backlog", "backlog_capacity", "backlog_hits", "backlog_misses", "backlog_evictions")
+
+    def __init__(self, agent_num: int, num_states: int, balance = 0, backlog_capacity: int = None):
         self.agent_num = agent_num
-        self.num_states = len(states_list)
+        self.num_states = num_states
         self.balance = balance
-        self.not_info = []
-        self.states = {}
+        self.not_info = frozenset()
+        self.info_key = 0
         self.uncertain = []
-        for state in states_list:
-            s = State(self, state, E)
-            self.states[state] = s
-    
+        self.uncertain_dividends = []
+        self.aspiration_backlog = None
+        self.backlog_capacity = backlog_capacity
+        self.backlog_hits, self.backlog_misses, self.backlog_evictions = 0, 0, 0
+
     def __str__(self) -> str:
         ans = f"Small world {self.agent_num} contains {self.num_states} states and ${self.balance}\n"
         ans += f"\tIt knows states {self.not_info} are not realized\n"
@@ -38,36 +54,74 @@ class SmallWorld:
         self.balance = 0
 
     def giveNotInfo(self, not_info) -> None:
-        self.not_info = not_info
+        self.not_info = frozenset(not_info)
         self.C = self.num_states - len(self.not_info)
         self.uncertain = {}
-        uncertain_states = filter(lambda s: s not in self.not_info, list(self.states.keys()))
-        for state_num in uncertain_states:
-            self.uncertain[state_num] = self.states[state_num].getDividend()
+        self.info_key = 0
+        for bit, state_num in enumerate(self.states.keys()):
+            if state_num in self.not_info:
+                self.info_key |= 1 << bit
+            else:
+                self.uncertain[state_num] = self.states[state_num].getDividend()
+        self.uncertain_dividends = sorted(self.uncertain.values())
+
+    # The aspiration backlog holds the aspirations of the last time the agent received the same pieces of information
+    # The number of combinations substantially increases with the number of pieces of information an agent gets in a period,
+    # so the least recently used info_keys are evicted once there are more than backlog_capacity of them
+    def updateAspirationBacklog(self, aspirations: 'List[float]') -> None:
+        if self.aspiration_backlog is None:
+            self.aspiration_backlog = {}
+        backlog = self.aspiration_backlog
+        # Reinserting a key moves it to the end of the dict, where the most recently used keys are
+        backlog.pop(self.info_key, None)
+        backlog[self.info_key] = array("d", aspirations)
+        if self.backlog_capacity and len(backlog) > self.backlog_capacity:
+            del backlog[next(iter(backlog))]
+            self.backlog_evictions += 1
+
+    # Returns the backlogged aspiration of each state, in the order of states, if the agent has received the same pieces of information before
+    # Otherwise, returns None
+    def aspirationBacklogLookup(self) -> 'array[float]':
+        aspirations = self.aspiration_backlog.get(self.info_key) if self.aspiration_backlog is not None else None
+        if aspirations is None:
+            self.backlog_misses += 1
+            return None
+        self.backlog_hits += 1
+        # Only a bounded backlog needs to know which keys were used most recently
+        if self.backlog_capacity:
+            del self.aspiration_backlog[self.info_key]
+            self.aspiration_backlog[self.info_key] = aspirations
+        return aspirations
 
     def getUncertainStates(self) -> 'List':
         return list(self.uncertain.keys())
 
     def removeUncertain(self, state_num: int) -> None:
-        del self.uncertain[state_num]
+        dividend = self.uncertain.pop(state_num)
+        del self.uncertain_dividends[bisect_left(self.uncertain_dividends, dividend)]
 
     # Used for representativeness module 3
     # Returns the closest dividend to the latest price that is within uncertain states
     # Return -1 if unable to find 
     def getClosestDividend(self, latest_price: float) -> float:
-        minDiff = float("inf")
-        ans = -1
-        for state_num, dividend in self.uncertain.items():
-            # This security is closer to the latest price
-            if minDiff > abs(latest_price - dividend):
-                minDiff = abs(latest_price - dividend)
-                ans = dividend
-        return ans
+        if not self.uncertain_dividends:
+            return -1
+        # The closest dividend is one of the two dividends around where the latest price would be inserted
+        pos = bisect_left(self.uncertain_dividends, latest_price)
+        if pos == 0:
+            return self.uncertain_dividends[0]
+        if pos == len(self.uncertain_dividends):
+            return self.uncertain_dividends[-1]
+        below, above = self.uncertain_dividends[pos - 1], self.uncertain_dividends[pos]
+        if abs(latest_price - below) != abs(latest_price - above):
+            return below if abs(latest_price - below) < abs(latest_price - above) else above
+        # When both are as close, the dividend of the state that comes first in uncertain wins
+        return next(dividend for dividend in self.uncertain.values() if dividend == below or dividend == above)
 
     def getStatesMap(self) -> dict:
         return self.states
 
-    def getNotInfo(self) -> 'List[int]':
+    def getNotInfo(self) -> 'FrozenSet[int]':
         return self.not_info
 
     def getAgentNum(self) -> int:
@@ -82,6 +136,27 @@ class SmallWorld:
     def getUncertainStatesMap(self) -> dict:
         return self.uncertain
 
+    # Returns the state numbers of this small world, in the order of states
+    def getStateNums(self) -> 'List[int]':
+        return list(self.states.keys())
+
     # Returns security object corresponding to security_num desired
     def getSecurity(self, security_num) -> State:
-        return self.states[security_num]
\ No newline at end of file
+        return self.states[security_num]
+
+class SmallWorld(BaseSmallWorld):
+    # Attributes:
+    # Everything of BaseSmallWorld
+    # balance: float                    cash balance
+    # states: dict{state_num: State}    dictionary of states in this small world with key state number and value State object
+
+    # Small worlds store their attributes in slots instead of a __dict__ to keep large worlds with many agents compact
+    __slots__ = ("balance", "states")
+
+    # Intialize a small world with its agent_number (number of the small world in a large world),
+    # a list of states that will be endowed with E each, as well as a cash balanace which is 0 by default
+    def __init__(self, agent_num: int, states_list, E: int, balance = 0, backlog_capacity: int = None):
+        BaseSmallWorld.__init__(self, agent_num, len(states_list), balance, backlog_capacity)
+        self.states = states = {}
+        for state in states_list:
+            states[state] = State(self, state, E)
@@ -0,0 +1,114 @@
+import random
+import sqlite3
+import time
+from itertools import product
+from multiprocessing import Pool
+import database_manager as dm
+from parse_input import INT_INPUTS, FLOAT_INPUTS, BOOL_INPUTS, obtainParameters, convertParameter
+from replications import runParameters
+
+# A sweep file of extension .sweep lists one setting or swept parameter per line, like an input file
+# base:example.in           input file that every job starts from
+# mode:grid                 'grid' runs every combination of values, 'list' runs the i'th value of every parameter together
+# workers:8                 number of jobs that run at the same time
+# replications:3            number of replications of every combination, 1 by default
+# seed:42                   seed that the seed of every job is derived from
+# alpha:0.05,0.1,0.2        any other line is a parameter of the input file and the comma separated values to sweep it over
+SWEEP_SETTINGS = ["base", "mode", "workers", "replications", "seed"]
+SWEEP_MODES = ["grid", "list"]
+
+# Reads in a sweep file
+# Returns a dictionary of settings and a dictionary linking each swept parameter to its list of values
+def obtainSweep(sweep_file: str) -> tuple:
+    settings = {"mode": "grid", "workers": 1, "replications": 1, "seed": None}
+    params = {}
+    with open(sweep_file, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            var_name, var = line.split(":")[0].strip(), line.split(":")[1].strip()
+            if var_name in SWEEP_SETTINGS:
+                settings[var_name] = var if var_name in ["base", "mode"] else int(var)
+            # Only parameters with a single value can be swept
+            elif var_name in INT_INPUTS + FLOAT_INPUTS + BOOL_INPUTS:
+                params[var_name] = [convertParameter(var_name, value.strip()) for value in var.split(",")]
+            else:
+                raise ValueError(f"{var_name} is not a parameter that can be swept")
+    if "base" not in settings:
+        raise ValueError("A sweep must name the base input file it starts from")
+    if settings["mode"] not in SWEEP_MODES:
+        raise ValueError(f"Sweep mode must be one of {SWEEP_MODES}")
+    return settings, params
+
+# Expands the swept parameters into the tuple of values of each combination to run
+def expandSweep(mode: str, params: dict) -> 'List[tuple]':
+    if mode == "grid":
+        return list(product(*params.values()))
+    if len(set(map(len, params.values()))) > 1:
+        raise ValueError("Every parameter of a sweep in list mode must have the same number of values")
+    return list(zip(*params.values()))
+
+# Runs a single job of a sweep in a worker process
+# Returns the name of the job and how many seconds it took
+def runSweepJob(args: tuple) -> tuple:
+    base, overrides, job_name, file_name, seed = args
+    start = time.time()
+    p = obtainParameters(base)
+    p.update(overrides)
+    p["file_name"] = file_name
+    p["seed"] = seed
+    runParameters(p)
+    return job_name, time.time() - start
+
+# Runs every job of a sweep that has not finished yet, at most settings["workers"] at a time
+# The manifest <sweep prefix>.db records every job and is updated as soon as a job finishes,
+# so running the same sweep file again after an interruption skips the jobs that already finished
+def runSweep(sweep_file: str) -> str:
+    settings, params = obtainSweep(sweep_file)
+    prefix = sweep_file[:-len(".sweep")] if sweep_file.endswith(".sweep") else sweep_file
+    manifest = prefix + ".db"
+    con = sqlite3.connect(manifest)
+    cur = con.cursor()
+    dm.createSweepJobsTable(cur, list(params.keys()))
+    finished = {job_name for (job_name,) in cur.execute("SELECT job_name FROM sweep_jobs WHERE status = 'finished'")}
+
+    jobs = []
+    for values in expandSweep(settings["mode"], params):
+        for replication_num in range(settings["replications"]):
+            job_name = "_".join(f"{param_name}{value}" for param_name, value in zip(params.keys(), values)) + f"_rep{replication_num}"
+            if job_name in finished:
+                continue
+            file_name = f"{prefix}_{job_name}"
+            # Seeds only depend on the sweep seed and the job, so they do not change when a sweep is resumed
+            seed = random.Random(f"{settings['seed']}:{job_name}").getrandbits(32)
+            placeholders = ", ".join(["?"] * (len(values) + 6))
+            cur.execute(f"INSERT OR REPLACE INTO sweep_jobs VALUES ({placeholders})",
+                        [job_name, *values, replication_num, seed, file_name + ".db", "pending", None])
+            jobs.append((settings["base"], dict(zip(params.keys(), values)), job_name, file_name, seed))
+    con.commit()
+    print(f"Running {len(jobs)} jobs of this sweep, {len(finished)} jobs already finished")
+
+    start = time.time()
+    with Pool(settings["workers"]) as pool:
+        for job_name, seconds in pool.imap_unordered(runSweepJob, jobs):
+            cur.execute("UPDATE sweep_jobs SET status = 'finished', seconds = ? WHERE job_name = ?", [seconds, job_name])
+            con.commit()
+    con.close()
+    end = time.time()
+    print(f"Successfully ran sweep. This took {round(end - start, 1)} seconds to run. The jobs of this sweep can be found in {manifest}")
+    return manifest
+
+# Returns a dictionary linking the tuple of swept parameter values of each combination
+# with the databases of its finished replications
+def obtainSweepResults(sweep_file: str) -> dict:
+    settings, params = obtainSweep(sweep_file)
+    prefix = sweep_file[:-len(".sweep")] if sweep_file.endswith(".sweep") else sweep_file
+    con = sqlite3.connect(prefix + ".db")
+    results = {}
+    columns = "".join(f"{param_name}, " for param_name in params.keys())
+    for row in con.execute(f"SELECT {columns}db_name FROM sweep_jobs WHERE status = 'finished' ORDER BY job_name"):
+        # SQLite stores booleans as integers
+        values = tuple(bool(value) if param_name in BOOL_INPUTS else value for param_name, value in zip(params.keys(), row[:-1]))
+        results.setdefault(values, []).append(row[-1])
+    con.close()
+    return results
@@ -0,0 +1,287 @@
+import random
+import numpy as np
+
+class VectorMarketTable2:
+    # Attributes:
+    # Layout, fixed for the whole simulation
+    # agents: List[SmallWorld]              every small world in the large world
+    # agent_start: dict{int: int}           position of the first security of an agent, keyed by agent number
+    # securities: List[State]               every security of every agent, grouped by agent in the order genBidAsk visits them, None with a SecurityStorage
+    # num_securities: int                   number of securities in the large world
+    # owner: ndarray[int]                   position in agents of the owner of each security
+    # state_nums: ndarray[int]              state number of each security
+    # market_of: ndarray[int]               position of the market each security trades in
+    # markets: List[int]                    state number traded in each market
+    # market_index: dict{int: int}          position of the market trading a state number
+    # by_midpoint: bool                     whether or not transaction prices should be the midpoint of the bid-ask spread
+    # db: DatabaseWriter                    buffered writer used to store transactions in database
+    # alpha: float                          alpha for post-transaction first order adaptive process
+    # rng: Generator                        NumPy random number generator used to draw the random prices
+    # storage: SecurityStorage              arrays backing the agents and securities, or None if they are plain objects
+
+    # Security state, loaded from the State objects at the start of a period and stored back at the end of it
+    # With a SecurityStorage, these are the storage arrays themselves and nothing needs to be copied
+    # aspiration: ndarray[float]            aspiration of each security
+    # amount: ndarray[int]                  amount of each security
+    # informed: ndarray[bool]               whether or not the owner of a security is uncertain about its state
+    # balance: ndarray[float]               cash balance of each agent
+
+    # Market state, one entry per market, mirrors the attributes of Market2
+    # bid, bidder, bidder_time              highest bid, position of the security that made it (-1 for none) and its iteration
+    # ask, asker, asker_time                lowest ask, position of the security that made it (-1 for none) and its iteration
+    # num_transactions: ndarray[int]        number of transactions have been conducted in each market in this period
+    # min_price: ndarray[float]             minimum price of a transaction in each market in this period
+    # price_mean, price_m2: ndarray[float]  running mean and sum of squared differences of the transaction prices of each market in this period
+    # online_statistics: bool               if True, the price statistics of each market are stored in prices_by_period at the end of each period
+    # period_num: int                       current period
+
+    # Vectorized replacement for MarketTable2
+    # All bids and asks of an iteration are drawn in one array operation and each market's best bid and ask are found with grouped reductions
+    # Follows the same time priority and midpoint rules as Market2 and writes the same rows to the transactions table
+    def __init__(self, L, small_worlds: dict, by_midpoint: bool, db, alpha: float, storage = None, online_statistics: bool = False):
+        self.by_midpoint, self.db, self.alpha = by_midpoint, db, alpha
+        self.storage = storage
+        self.online_statistics = online_statistics
+        # Seed from the global random state so that seeding random reproduces a run
+        self.rng = np.random.default_rng(random.getrandbits(64))
+
+        self.markets = list(L)
+        self.market_index = {state_num: m for m, state_num in enumerate(self.markets)}
+        self.agents = list(small_worlds.values())
+        # A SecurityStorage already lays the securities out agent by agent, so no State objects need to be gathered
+        if storage is not None:
+            self.securities = None
+            self.agent_start = {agent.agent_num: int(start) for agent, start in zip(self.agents, storage.agent_ptr.tolist())}
+            self.owner = np.repeat(np.arange(len(self.agents), dtype=np.int64), np.diff(storage.agent_ptr))
+            self.state_nums = storage.state_nums
+        else:
+            self.agent_start = {}
+            self.securities = []
+            owner = []
+            for agent_pos, agent in enumerate(self.agents):
+                self.agent_start[agent.agent_num] = len(self.securities)
+                for state in agent.getStatesMap().values():
+                    self.securities.append(state)
+                    owner.append(agent_pos)
+            self.owner = np.array(owner, dtype=np.int64)
+            self.state_nums = np.array([state.state_num for state in self.securities], dtype=np.int64)
+        self.num_securities = len(self.state_nums)
+        self.market_of = np.array([self.market_index[state_num] for state_num in self.state_nums.tolist()], dtype=np.int64)
+
+        num_markets = len(self.markets)
+        self.bid = np.zeros(num_markets)
+        self.ask = np.ones(num_markets)
+        self.bidder = np.full(num_markets, -1, dtype=np.int64)
+        self.asker = np.full(num_markets, -1, dtype=np.int64)
+        self.bidder_time = np.full(num_markets, -1, dtype=np.int64)
+        self.asker_time = np.full(num_markets, -1, dtype=np.int64)
+        self.num_transactions = np.zeros(num_markets, dtype=np.int64)
+        self.min_price = np.ones(num_markets)
+        self.price_mean = np.zeros(num_markets)
+        self.price_m2 = np.zeros(num_markets)
+        self.period_num = 0
+        self.loadPeriod()
+
+    def __str__(self) -> str:
+        ans = "Market Table:\n"
+        for m in sorted(range(len(self.markets)), key=lambda m: self.markets[m]):
+            bidder_str = self.agents[self.owner[self.bidder[m]]].agent_num if self.bidder[m] != -1 else None
+            asker_str = self.agents[self.owner[self.asker[m]]].agent_num if self.asker[m] != -1 else None
+            ans += f"{self.markets[m]}: ({round(self.bid[m],2)},{bidder_str},{self.bidder_time[m]}) - ({round(self.ask[m],2)},{asker_str},{self.asker_time[m]})\n"
+        return ans
+
+    # Copies aspirations, amounts, information and balances from the State and SmallWorld objects into arrays
+    # Called at the start of a period once every agent has been given its information
+    def loadPeriod(self) -> None:
+        # Securities in a SecurityStorage are laid out in the same order as securities
+        if self.storage is not None:
+            self.aspiration = self.storage.aspiration
+            self.amount = self.storage.amount
+            self.informed = ~self.storage.not_info
+            self.balance = self.storage.balance
+            return
+        self.aspiration = np.array([state.aspiration for state in self.securities], dtype=float)
+        self.amount = np.array([state.amount for state in self.securities], dtype=np.int64)
+        self.informed = np.array([state.state_num not in state.parent_world.not_info for state in self.securities], dtype=bool)
+        self.balance = np.array([agent.balance for agent in self.agents], dtype=float)
+
+    # Copies the arrays back into the State and SmallWorld objects so that the period can be realized
+    def storePeriod(self) -> None:
+        if self.storage is not None:
+            return
+        for state, aspiration, amount in zip(self.securities, self.aspiration.tolist(), self.amount.tolist()):
+            state.aspiration = aspiration
+            state.amount = amount
+        for agent, balance in zip(self.agents, self.balance.tolist()):
+            agent.balance = balance
+
+    # Reloads the aspirations of a single agent after they were changed on its State objects
+    # Used after representativeness module Mike adjusts an agent's aspirations in the middle of a period
+    def pullAgent(self, agent) -> None:
+        if self.storage is not None:
+            return
+        start = self.agent_start[agent.agent_num]
+        self.aspiration[start:start + agent.num_states] = [state.aspiration for state in agent.getStatesMap().values()]
+
+    # Called at the end of a period to reset all the markets
+    # R is the set of states realized in the period that is ending
+    def tableReset(self, R = ()) -> None:
+        if self.online_statistics:
+            self.db.insertMany("prices_by_period", [
+                [state_num, self.period_num, mean, st_dev, volume, 1 if state_num in R else 0]
+                for state_num, (mean, st_dev, volume) in self.getPriceStatistics().items()
+            ])
+        self.bid[:] = 0
+        self.ask[:] = 1
+        self.bidder[:] = -1
+        self.asker[:] = -1
+        self.bidder_time[:] = -1
+        self.asker_time[:] = -1
+        self.num_transactions[:] = 0
+        self.min_price[:] = 1
+        self.price_mean[:] = 0
+        self.price_m2[:] = 0
+        self.period_num += 1
+
+    # Sets the period every market is in, used when resuming from a checkpoint
+    def setPeriod(self, period_num: int) -> None:
+        self.period_num = period_num
+
+    # Draws a random price for every security
+    def drawPrices(self) -> 'ndarray':
+        return self.rng.random(self.num_securities)
+
+    # Among orders in positions idx with prices, returns the markets that received an order together with
+    # the position and price of the best order in each of them
+    # Ties go to the earliest order, just like the strict comparisons in Market2
+    def bestOrders(self, idx, prices, highest: bool):
+        markets = self.market_of[idx]
+        if not idx.size:
+            return markets, idx, prices
+        # lexsort is stable, so within a market and price orders stay in the order they were made
+        order = np.lexsort((-prices if highest else prices, markets))
+        markets = markets[order]
+        first = np.flatnonzero(np.r_[True, markets[1:] != markets[:-1]])
+        best = order[first]
+        return markets[first], idx[best], prices[best]
+
+    # Each security generates a random price, which is a bid if it is at most its aspiration and an ask otherwise
+    # Each market keeps its standing order unless the best new order beats it
+    def genBidAsk(self, time: int) -> None:
+        prices = self.drawPrices()
+        is_ask = prices > self.aspiration
+
+        bids = np.flatnonzero(~is_ask)
+        markets, bidders, bid_prices = self.bestOrders(bids, prices[bids], True)
+        replace = (self.bidder[markets] == -1) | (bid_prices > self.bid[markets])
+        markets = markets[replace]
+        self.bid[markets] = bid_prices[replace]
+        self.bidder[markets] = bidders[replace]
+        self.bidder_time[markets] = time
+
+        # Only securities with a positive balance are able to ask
+        asks = np.flatnonzero(is_ask & (self.amount > 0))
+        markets, askers, ask_prices = self.bestOrders(asks, prices[asks], False)
+        replace = (self.asker[markets] == -1) | (ask_prices < self.ask[markets])
+        markets = markets[replace]
+        self.ask[markets] = ask_prices[replace]
+        self.asker[markets] = askers[replace]
+        self.asker_time[markets] = time
+
+    # Conducts a market clearing transaction in every market whose best bid is at least its best ask
+    # Called at the end of an iteration
+    def tableMarketMake(self, time: int) -> None:
+        markets = np.flatnonzero(
+            (self.bidder != -1)
+            & (self.asker != -1)
+            & (self.bidder != self.asker)
+            & (self.bid >= self.ask)
+        )
+        if not markets.size:
+            return
+        bid, ask = self.bid[markets], self.ask[markets]
+        bidder, asker = self.bidder[markets], self.asker[markets]
+        bidder_time, asker_time = self.bidder_time[markets], self.asker_time[markets]
+        # Determine transaction prices
+        if self.by_midpoint:
+            prices = (bid + ask) / 2
+        else:
+            prices = np.where(bidder_time < asker_time, bid, ask)
+        self.min_price[markets] = np.minimum(self.min_price[markets], prices)
+
+        # Adjust security amounts and balances
+        # Balances are updated seller then buyer, market by market, in the same order as Market2
+        buyers, sellers = self.owner[bidder], self.owner[asker]
+        np.add.at(self.balance, np.column_stack((sellers, buyers)).ravel(), np.column_stack((prices, -1 * prices)).ravel())
+        self.amount[asker] -= 1
+        self.amount[bidder] += 1
+
+        # Store transaction data in database
+        rows = []
+        for row in zip(
+            self.state_nums[bidder].tolist(),
+            self.num_transactions[markets].tolist(),
+            buyers.tolist(),
+            sellers.tolist(),
+            prices.tolist(),
+            (bidder_time > asker_time).tolist(),
+            bid.tolist(),
+            self.aspiration[bidder].tolist(),
+            ask.tolist(),
+            self.aspiration[asker].tolist(),
+            (bid - ask).tolist(),
+        ):
+            state_num, transaction_num, buyer_pos, seller_pos, price, action, b, b_aspiration, a, a_aspiration, spread = row
+            rows.append([
+                self.period_num,
+                time,
+                state_num,
+                transaction_num,
+                self.agents[buyer_pos].agent_num,
+                self.agents[seller_pos].agent_num,
+                price,
+                1 if action else 0,
+                b,
+                b_aspiration,
+                a,
+                a_aspiration,
+                spread,
+            ])
+        self.db.insertMany("transactions", rows)
+        self.num_transactions[markets] += 1
+        # Update the running price statistics using Welford's algorithm
+        delta = prices - self.price_mean[markets]
+        self.price_mean[markets] += delta / self.num_transactions[markets]
+        self.price_m2[markets] += delta * (prices - self.price_mean[markets])
+
+        # Apply the first order adaptive process to all participants that have a traded security in their small world
+        traded_price = np.full(len(self.markets), np.nan)
+        traded_price[markets] = prices
+        security_price = traded_price[self.market_of]
+        adapt = self.informed & ~np.isnan(security_price)
+        self.aspiration[adapt] = self.alpha * security_price[adapt] + (1 - self.alpha) * self.aspiration[adapt]
+
+        # Reset the markets after a successful transaction
+        self.bid[markets] = 0
+        self.ask[markets] = 1
+        self.bidder[markets] = -1
+        self.asker[markets] = -1
+        self.bidder_time[markets] = time
+        self.asker_time[markets] = time
+
+    # Returns a dictionary linking the state number of each market with the mean, standard deviation and volume of its prices in this period
+    def getPriceStatistics(self) -> dict:
+        volume = self.num_transactions
+        st_dev = np.sqrt(self.price_m2 / np.maximum(volume - 1, 1)) * (volume > 1)
+        return {
+            state_num: (mean, sd, v)
+            for state_num, mean, sd, v in zip(self.markets, self.price_mean.tolist(), st_dev.tolist(), volume.tolist())
+        }
+
+    # Returns the number of transactions conducted in all markets in this period
+    def getNumTransactions(self) -> int:
+        return int(self.num_transactions.sum())
+
+    # Returns the minimum price for the market of state_num
+    def getMarketMinPrice(self, state_num: int) -> float:
+        return float(self.min_price[self.market_index[state_num]])